@@ -1,27 +1,27 @@
 import sys
 import os
-import re
-import zipfile
-import requests
-import tempfile
-from bs4 import BeautifulSoup
-from datetime import datetime
+import multiprocessing
+import shutil
 from PyQt6.QtWidgets import (
     QMainWindow, QMessageBox,
     QApplication, QWidget, QVBoxLayout, QLabel, QProgressBar, QPushButton,
-    QTableWidget, QTableWidgetItem, QFileDialog, QLineEdit
+    QTableView, QFileDialog, QLineEdit, QHBoxLayout, QCheckBox, QDoubleSpinBox
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QFont, QAction
 import pandas as pd
 from functools import partial
-import geopandas as gpd
+from wkmapper.config import AKTUELLES_JAHR, CHUNK_ZEILEN, DOWNLOAD_REGEX, FILTER_VERZOEGERUNG_MS, MIN_ANTEIL, STARTJAHR
+from wkmapper.downloads import default_cache
+from wkmapper.export import EXPORT_FILTER, KOMPRIMIERUNG_ENDUNGEN
+from wkmapper.geodata import GEODATEN_DIR
+from wkmapper.instrumentation import aktiv, aktivieren, sammeln, stufe, zusammenfassung
+from wkmapper.jobs import JobManager
+from wkmapper.pipeline import INDEX_DIR, export_result, fetch_archive, map_shapefiles, map_upload, mit_filter, prepare_batch, prepare_plz, prepare_wahl
+from wkmapper.scraper import links_from_manifest, load_manifest, scrape_all
+from wkmapper.store import LookupStore
+from wkmapper.tablemodel import DataFrameModel
 
-STARTJAHR = 2017
-AKTUELLES_JAHR = datetime.now().year
-BASIS_URL = "https://www.bundeswahlleiterin.de/bundestagswahlen/{}/wahlkreiseinteilung/downloads.html"
-DOWNLOAD_REGEX = re.compile(r"geometrie_wahlkreise_vg250_(geo_shp|shp_geo)\.zip", re.IGNORECASE)
-PLZ_URL = "https://services2.arcgis.com/jUpNdisbWqRpMo35/arcgis/rest/services/PLZ_Gebiete/FeatureServer/replicafilescache/PLZ_Gebiete_-6414732440474739110.zip"
 
 class ScraperThread(QThread):
     progress = pyqtSignal(int, int)
@@ -29,26 +29,15 @@ class ScraperThread(QThread):
     finished = pyqtSignal(list)
 
     def run(self):
-        self.links = []
         jahre = list(range(STARTJAHR, AKTUELLES_JAHR + 1))
-        for index, jahr in enumerate(jahre):
-            url = BASIS_URL.format(jahr)
-            try:
-                r = requests.get(url, timeout=10)
-                soup = BeautifulSoup(r.text, 'html.parser')
-                link_tags = soup.find_all('a', href=True)
-                matching_links = [tag['href'] for tag in link_tags if DOWNLOAD_REGEX.search(tag['href'])]
-                if matching_links:
-                    for link in matching_links:
-                        full_link = requests.compat.urljoin(url, link)
-                        self.links.append((jahr, full_link))
-                    self.url_checked.emit(url, True)
-                else:
-                    self.url_checked.emit(url, False)
-            except Exception as e:
-                print(f"Fehler beim Abrufen von {url}: {e}")
-                self.url_checked.emit(url, False)
-            self.progress.emit(index + 1, len(jahre))
+        geprueft = []
+
+        def on_page(url, ok):
+            geprueft.append(url)
+            self.url_checked.emit(url, ok)
+            self.progress.emit(len(geprueft), len(jahre))
+
+        self.links = scrape_all(jahre, on_page=on_page)
         self.finished.emit(self.links)
 
 from PyQt6.QtWidgets import QLineEdit
@@ -98,7 +87,7 @@ class DownloaderApp(QMainWindow):
                 background-color: #444;
                 color: #f0f0f0;
             }
-            QTableWidget {
+            QTableView {
                 gridline-color: #444;
                 background-color: #3a3a3a;
                 alternate-background-color: #2e2e2e;
@@ -117,22 +106,36 @@ class DownloaderApp(QMainWindow):
         datei_menu = menubar.addMenu("Datei")
         info_menu = menubar.addMenu("Info")
 
-        export_action = QAction("Export als CSV", self)
-        export_action.triggered.connect(self.export_csv)
+        export_action = QAction("Exportieren...", self)
+        export_action.triggered.connect(self.export_table)
         datei_menu.addAction(export_action)
 
         neustarten_action = QAction("Neustarten", self)
         neustarten_action.triggered.connect(self.reset_to_start)
         datei_menu.addAction(neustarten_action)
 
+        cache_action = QAction("Zwischenspeicher leeren", self)
+        cache_action.triggered.connect(self.clear_lookup_store)
+        datei_menu.addAction(cache_action)
+
+        downloads_action = QAction("Heruntergeladene Dateien löschen", self)
+        downloads_action.triggered.connect(self.clear_download_cache)
+        datei_menu.addAction(downloads_action)
+
         beenden_action = QAction("Beenden", self)
-        beenden_action.triggered.connect(QApplication.instance().quit)
+        beenden_action.triggered.connect(self.close)
         datei_menu.addAction(beenden_action)
 
         about_action = QAction("Über", self)
         about_action.triggered.connect(self.show_about_dialog)
         info_menu.addAction(about_action)
 
+        profil_action = QAction("Laufzeiten messen", self)
+        profil_action.setCheckable(True)
+        profil_action.setChecked(aktiv())
+        profil_action.toggled.connect(self.toggle_profiling)
+        info_menu.addAction(profil_action)
+
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         self.layout = QVBoxLayout()
@@ -146,23 +149,29 @@ class DownloaderApp(QMainWindow):
 
         self.filter_input = QLineEdit()
         self.filter_input.setPlaceholderText("Filter nach PLZ oder Wahlkreis...")
-        self.filter_input.textChanged.connect(self.filter_table)
+        # Erst filtern, wenn die Eingabe kurz ruht, nicht bei jedem Tastendruck.
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_VERZOEGERUNG_MS)
+        self.filter_timer.timeout.connect(lambda: self.filter_table(self.filter_input.text()))
+        self.filter_input.textChanged.connect(lambda _: self.filter_timer.start())
         self.filter_input.hide()
         self.layout.addWidget(self.filter_input)
 
         self.links = links
-        self.plz_shapefile = None
-        self.wk_shapefile = None
-        self.ensure_plz_shapefile_exists()
+        self.lookup_store = LookupStore()
+        self.jobs = JobManager(parent=self)
+        self.aktive_wahl = None
+        self.plz_archiv = None
+        self.wk_archiv = None
         self.back_button = QPushButton("Zurück")
         self.back_button.clicked.connect(self.reset_to_start)
         self.back_button.hide()
         self.layout.addWidget(self.back_button)
 
-        self.tabelle = QTableWidget()
+        self.tabelle = QTableView()
         self.tabelle.setSortingEnabled(True)
-        self.tabelle.setColumnCount(3)
-        self.tabelle.setHorizontalHeaderLabels(["Jahr", "Download-Link", ""])
+        self.tabelle.setAlternatingRowColors(True)
 
         self.excel_upload_btn = QPushButton("Datei hochladen (Excel/CSV)")
         self.excel_upload_btn.setToolTip("Lade z.B. eine Wählerliste mit Postleitzahlen hoch,\num sie Wahlkreisen zuzuordnen.")
@@ -170,301 +179,294 @@ class DownloaderApp(QMainWindow):
         self.layout.addWidget(self.excel_upload_btn)
         self.excel_upload_btn.setEnabled(False)
 
-        self.tabelle.setRowCount(len(self.links))
-        
-        for row, (jahr, url) in enumerate(self.links):
-            jahr_text = f"BTW {jahr}" if "btw" in url else str(jahr)
-            self.tabelle.setItem(row, 0, QTableWidgetItem(jahr_text))
-            self.tabelle.setItem(row, 1, QTableWidgetItem(url))
-
-            if DOWNLOAD_REGEX.search(url):
-                match_btn = QPushButton("Auswählen")
-                match_btn.clicked.connect(partial(self.download_extract_and_map, url))
-                self.tabelle.setCellWidget(row, 2, match_btn)
-                match_btn.setProperty("removable", True)
+        self.batch_btn = QPushButton("Alle Wahlen zuordnen")
+        self.batch_btn.setToolTip("Ordnet jede PLZ den Wahlkreisen aller gefundenen Wahlen zu,\nmit einer Spalte je Wahljahr.")
+        self.batch_btn.clicked.connect(self.map_all_elections)
+        self.layout.addWidget(self.batch_btn)
+
+        self.anteil_checkbox = QCheckBox("Flächenanteile berechnen")
+        self.anteil_checkbox.setToolTip("Ordnet jede PLZ allen Wahlkreisen mit ihrem Flächenanteil zu\nund markiert den Hauptwahlkreis.")
+        self.anteil_spinbox = QDoubleSpinBox()
+        self.anteil_spinbox.setPrefix("Mindestanteil: ")
+        self.anteil_spinbox.setSuffix(" %")
+        self.anteil_spinbox.setRange(0, 50)
+        self.anteil_spinbox.setValue(MIN_ANTEIL * 100)
+        self.anteil_spinbox.setEnabled(False)
+        self.anteil_checkbox.toggled.connect(self.anteil_spinbox.setEnabled)
+        modus_layout = QHBoxLayout()
+        modus_layout.addWidget(self.anteil_checkbox)
+        modus_layout.addWidget(self.anteil_spinbox)
+        self.layout.addLayout(modus_layout)
+
+        self.show_links()
 
         self.download_label = QLabel("Download-Status")
+        self.stufen_label = QLabel("")
+        self.stufen_label.setWordWrap(True)
+        self.stufen_label.setStyleSheet("font-size: 11px; color: #bbb;")
+        self.stufen_label.setVisible(aktiv())
+        self.letzte_stufen = []
+        self.jobs.stages.connect(self.show_stages)
         self.download_bar = QProgressBar()
+        self.cancel_button = QPushButton("Abbrechen")
+        self.cancel_button.clicked.connect(self.cancel_jobs)
+        self.cancel_button.hide()
 
         self.layout.addWidget(self.tabelle)
         self.layout.addWidget(self.download_label)
+        self.layout.addWidget(self.stufen_label)
         self.layout.addWidget(self.download_bar)
+        self.layout.addWidget(self.cancel_button)
 
-        
-        self.tabelle.resizeColumnsToContents()
-        total_width = sum([self.tabelle.columnWidth(i) for i in range(self.tabelle.columnCount())])
-        self.resize(total_width + 60, self.tabelle.sizeHint().height() + 150)
+        self.ensure_plz_shapefile_exists()
 
-    def reset_to_start(self):
-        self.tabelle.setRowCount(len(self.links))
-        self.tabelle.setColumnCount(3)
-        self.tabelle.setHorizontalHeaderLabels(["Jahr", "Download-Link", ""])
-        self.filter_input.hide()
-        self.back_button.hide()
+        self.resize_to_table(60, 150)
 
-        for row, (jahr, url) in enumerate(self.links):
-            jahr_text = f"BTW {jahr}" if "btw" in url else str(jahr)
-            self.tabelle.setItem(row, 0, QTableWidgetItem(jahr_text))
-            self.tabelle.setItem(row, 1, QTableWidgetItem(url))
+    def set_links(self, links):
+        if links == self.links:
+            return
+        self.links = links
+        if self.zeigt_links:
+            self.show_links()
+
+    def show_links(self):
+        self.zeigt_links = True
+        links_df = pd.DataFrame(
+            [(f"BTW {jahr}" if "btw" in url else str(jahr), url, "") for jahr, url in self.links],
+            columns=["Jahr", "Download-Link", ""],
+        )
+        self.set_table(DataFrameModel(links_df))
 
+        for row, (jahr, url) in enumerate(self.links):
             if DOWNLOAD_REGEX.search(url):
                 match_btn = QPushButton("Auswählen")
                 match_btn.clicked.connect(partial(self.download_extract_and_map, url))
-                match_btn.setProperty("removable", True)
-                self.tabelle.setCellWidget(row, 2, match_btn)
-
+                self.tabelle.setIndexWidget(self.model.index(row, 2), match_btn)
+
+    def set_table(self, model):
+        self.model = model
+        self.tabelle.setModel(model)
+        self.tabelle.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+
+    def show_result(self, df, headers=None, filter_index=None):
+        self.zeigt_links = False
+        with sammeln() as anzeige, stufe("anzeigen", zeilen=len(df)):
+            self.set_table(DataFrameModel(df, headers, filter_index=filter_index))
+        self.filter_input.clear()
+        if anzeige:
+            self.show_stages(None, self.letzte_stufen + anzeige)
+
+    def toggle_profiling(self, an):
+        aktivieren(an)
+        self.stufen_label.setVisible(an)
+
+    def show_stages(self, ressource, stufen):
+        self.letzte_stufen = stufen
+        self.stufen_label.setText(f"Laufzeiten: {zusammenfassung(stufen)}")
+        self.stufen_label.setToolTip("\n".join(
+            f"{eintrag['stufe']}: {eintrag['sekunden']:.3f} s, {eintrag['rss_mb']} MB (+{eintrag['zuwachs_mb']} MB)"
+            for eintrag in stufen
+        ))
+
+    def resize_to_table(self, extra_width, extra_height):
         self.tabelle.resizeColumnsToContents()
-        total_width = sum([self.tabelle.columnWidth(i) for i in range(self.tabelle.columnCount())])
-        self.resize(total_width + 80, self.tabelle.sizeHint().height() + 150)
+        total_width = sum([self.tabelle.columnWidth(i) for i in range(self.model.columnCount())])
+        self.resize(total_width + extra_width, self.tabelle.sizeHint().height() + extra_height)
+
+    def reset_to_start(self):
+        self.filter_input.hide()
+        self.back_button.hide()
+        self.show_links()
+        self.resize_to_table(80, 150)
 
 
         
 
     def ensure_plz_shapefile_exists(self):
-        local_filename = os.path.join(tempfile.gettempdir(), os.path.basename(PLZ_URL))
-        extract_path = os.path.join(tempfile.gettempdir(), "plz_shapefiles")
-
-        if self.plz_shapefile and os.path.exists(self.plz_shapefile):
+        if self.plz_archiv and os.path.exists(self.plz_archiv):
             return
 
-        if not os.path.exists(extract_path):
-            os.makedirs(extract_path, exist_ok=True)
-
-        if not os.path.exists(local_filename):
-            self.download_label.setText("PLZ-Daten werden heruntergeladen...")
-            try:
-                with requests.get(PLZ_URL, stream=True) as r:
-                    r.raise_for_status()
-                    with open(local_filename, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-            except Exception as e:
-                self.download_label.setText(f"Fehler beim PLZ-Download: {e}")
-                return
-
-        try:
-            with zipfile.ZipFile(local_filename, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
-
-            for root, dirs, files in os.walk(extract_path):
-                for file in files:
-                    if file.endswith(".shp"):
-                        self.plz_shapefile = os.path.join(root, file)
-                        return
-
-        except Exception as e:
-            self.download_label.setText(f"Fehler beim Entpacken der PLZ-Daten: {e}")
+        job, neu = self.jobs.submit("plz", prepare_plz)
+        if neu:
+            job.signals.progress.connect(self.show_progress)
+            job.signals.finished.connect(self.plz_ready)
+            job.signals.failed.connect(lambda e: self.job_ended(f"Fehler beim Laden der PLZ-Daten: {e}"))
+            job.signals.cancelled.connect(lambda: self.job_ended("Laden der PLZ-Daten abgebrochen."))
+            self.update_cancel_button()
+
+    def plz_ready(self, plz_archiv):
+        self.plz_archiv = plz_archiv
+        self.job_ended("PLZ-Daten bereit.")
 
     def download_file(self, url):
-        self.download_label.setText(f"Lade: {url}")
-        local_filename = os.path.join(tempfile.gettempdir(), os.path.basename(url))
-        try:
-            with requests.get(url, stream=True) as r:
-                r.raise_for_status()
-                total = int(r.headers.get('content-length', 0))
-                downloaded = 0
-                with open(local_filename, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            if total > 0:
-                                percent = int(downloaded * 100 / total)
-                                self.download_bar.setValue(percent)
-            self.download_label.setText(f"Download abgeschlossen: {local_filename}")
-        except Exception as e:
-            self.download_label.setText(f"Fehler: {e}")
+        job, neu = self.jobs.submit(("download", url), fetch_archive, url)
+        if neu:
+            job.signals.progress.connect(self.show_progress)
+            job.signals.finished.connect(lambda pfad: self.job_ended(f"Download abgeschlossen: {pfad}"))
+            job.signals.failed.connect(lambda e: self.job_ended(f"Fehler: {e}"))
+            job.signals.cancelled.connect(lambda: self.job_ended("Download abgebrochen."))
+            self.update_cancel_button()
+
+    def show_progress(self, text, percent):
+        self.download_label.setText(text)
+        if percent < 0:
+            self.download_bar.setRange(0, 0)
+        else:
+            self.download_bar.setRange(0, 100)
+            self.download_bar.setValue(percent)
+
+    def job_ended(self, text):
+        self.download_bar.setRange(0, 100)
+        self.download_bar.setValue(0)
+        if text:
+            self.download_label.setText(text)
+        self.update_cancel_button()
+
+    def update_cancel_button(self):
+        self.cancel_button.setVisible(bool(self.jobs.jobs))
+
+    def cancel_jobs(self):
+        self.jobs.cancel_all()
+        self.download_label.setText("Wird abgebrochen...")
 
     def download_and_extract_plz(self):
-        self.tabelle.setRowCount(len(self.links))
-        self.tabelle.setColumnCount(3)
-        self.tabelle.setHorizontalHeaderLabels(["Jahr", "Download-Link", ""])
-        self.filter_input.hide()
-        self.back_button.hide()
-
-        for row, (jahr, url) in enumerate(self.links):
-            jahr_text = f"BTW {jahr}" if "btw" in url else str(jahr)
-            self.tabelle.setItem(row, 0, QTableWidgetItem(jahr_text))
-            self.tabelle.setItem(row, 1, QTableWidgetItem(url))
-
-            if DOWNLOAD_REGEX.search(url):
-                match_btn = QPushButton("Auswählen")
-                match_btn.clicked.connect(partial(self.download_extract_and_map, url))
-                match_btn.setProperty("removable", True)
-                self.tabelle.setCellWidget(row, 2, match_btn)
-
-        self.tabelle.resizeColumnsToContents()
-        total_width = sum([self.tabelle.columnWidth(i) for i in range(self.tabelle.columnCount())])
-        self.resize(total_width + 80, self.tabelle.sizeHint().height() + 150)
+        self.reset_to_start()
 
     def upload_excel_and_map(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Excel-Datei auswählen", "", "Excel-Dateien (*.xlsx *.xls *.csv)")
         if not file_path:
             return
 
-        try:
-            if file_path.endswith(".csv"):
-                df = pd.read_csv(file_path, dtype=str)
-            else:
-                df = pd.read_excel(file_path, dtype=str)
-
-            plz_spalten = [col for col in df.columns if col.lower() in ["plz", "postleitzahl"]]
-            if not plz_spalten:
-                QMessageBox.warning(self, "Fehlende Spalte", "Die Datei muss eine Spalte namens 'plz' oder 'Postleitzahl' enthalten.")
-                return
-
-            df.rename(columns={plz_spalten[0]: "plz"}, inplace=True)
-
-            df["plz"] = df["plz"].astype(str).str.lower()
-
-            gdf_plz = gpd.read_file(self.plz_shapefile).to_crs("EPSG:25832")
-            gdf_plz["plz"] = gdf_plz["plz"].astype(str).str.lower()
-            df_plz_geom = pd.merge(df, gdf_plz[["plz", "geometry"]], on="plz", how="left")
-            gdf_plz_geom = gpd.GeoDataFrame(df_plz_geom, geometry="geometry", crs=gdf_plz.crs)
-
-            wk_shapefile = self.wk_shapefile
-            if not self.wk_shapefile:
-                QMessageBox.warning(self, "Kein Wahlkreis-Shapefile", "Bitte zuerst eine Wahl auswählen.")
-                return
-            if not wk_shapefile:
-                return
-
-            gdf_wk = gpd.read_file(self.wk_shapefile).to_crs("EPSG:25832")
-            gdf_joined = gpd.sjoin(gdf_plz_geom, gdf_wk, how="left", predicate="intersects")
-            wk_spalten = [col for col in gdf_joined.columns if col.lower() in ["wknr", "wkr_nr", "nummer", "wahlkreis", "wkr"] or col.lower().startswith("wk")]
-
-            if wk_spalten:
-                gdf_joined.rename(columns={wk_spalten[0]: "wahlkreis"}, inplace=True)
-
-            merged = gdf_joined[[*df.columns, "wahlkreis"]] if "wahlkreis" in gdf_joined.columns else df
-
-            self.tabelle.setRowCount(len(merged))
-            self.tabelle.setColumnCount(len(merged.columns))
-            self.tabelle.setHorizontalHeaderLabels(merged.columns.tolist())
-
-            for i, row in merged.iterrows():
-                for j, col in enumerate(merged.columns):
-                    self.tabelle.setItem(i, j, QTableWidgetItem(str(row[col])))
-
-            self.download_label.setText("Mapping abgeschlossen.")
-            self.filter_input.show()
-            self.back_button.show()
+        if not self.wk_archiv:
+            QMessageBox.warning(self, "Kein Wahlkreis-Shapefile", "Bitte zuerst eine Wahl auswählen.")
+            return
 
-        except Exception as e:
-            QMessageBox.critical(self, "Fehler beim Excel-Mapping", str(e))
-            self.download_label.setText("Fehler beim Mapping.")
+        job, neu = self.jobs.submit(("upload", file_path), mit_filter, map_upload, file_path, self.plz_archiv, self.wk_archiv)
+        if neu:
+            job.signals.progress.connect(self.show_progress)
+            job.signals.finished.connect(self.upload_mapped)
+            job.signals.failed.connect(self.upload_failed)
+            job.signals.cancelled.connect(lambda: self.job_ended("Mapping abgebrochen."))
+            self.update_cancel_button()
+
+    def upload_mapped(self, ergebnis):
+        merged, filter_index = ergebnis
+        self.show_result(merged, filter_index=filter_index)
+        self.job_ended("Mapping abgeschlossen.")
+        self.filter_input.show()
+        self.back_button.show()
+
+    def upload_failed(self, fehler):
+        self.job_ended("Fehler beim Mapping.")
+        QMessageBox.critical(self, "Fehler beim Excel-Mapping", fehler)
+
+    def closeEvent(self, event):
+        self.jobs.shutdown()
+        super().closeEvent(event)
+
+    def clear_lookup_store(self):
+        self.lookup_store.clear()
+        shutil.rmtree(INDEX_DIR, ignore_errors=True)
+        self.download_label.setText("Zwischenspeicher geleert.")
+
+    def clear_download_cache(self):
+        if self.jobs.jobs:
+            self.download_label.setText("Bitte warten, bis alle Vorgänge abgeschlossen sind.")
+            return
+        default_cache().clear()
+        # Auch GeoParquet-Kopien und Kacheln, die noch keinem Archiv zugeordnet waren.
+        shutil.rmtree(GEODATEN_DIR, ignore_errors=True)
+        self.plz_archiv = self.wk_archiv = None
+        self.excel_upload_btn.setEnabled(False)
+        self.download_label.setText("Heruntergeladene Dateien gelöscht.")
+        self.ensure_plz_shapefile_exists()
 
     def show_about_dialog(self):
         QMessageBox.about(self, "Über", "PLZ2WK - Der Wahlkreis-PLZ-Mapper\n© 2025 Dennis Wörner")
 
-    def export_csv(self):
-        path, _ = QFileDialog.getSaveFileName(self, "CSV speichern", "ergebnisse.csv", "CSV-Dateien (*.csv)")
+    def export_table(self):
+        path, auswahl = QFileDialog.getSaveFileName(self, "Ergebnisse speichern", "ergebnisse.csv", ";;".join(EXPORT_FILTER))
         if not path:
             return
-
-        headers = [self.tabelle.horizontalHeaderItem(i).text() for i in range(self.tabelle.columnCount())]
-        rows = []
-        for row in range(self.tabelle.rowCount()):
-            if self.tabelle.isRowHidden(row):
-                continue
-            data = []
-            for col in range(self.tabelle.columnCount()):
-                item = self.tabelle.item(row, col)
-                data.append(item.text() if item else "")
-            rows.append(data)
-
-        df = pd.DataFrame(rows, columns=headers)
-        df.to_csv(path, index=False)
+        if not path.lower().endswith(tuple(EXPORT_FILTER.values()) + tuple(KOMPRIMIERUNG_ENDUNGEN)):
+            path += EXPORT_FILTER.get(auswahl, ".csv")
+
+        # Eine noch wartende Filtereingabe zuerst anwenden, damit genau die sichtbaren Zeilen exportiert werden.
+        if self.filter_timer.isActive():
+            self.filter_timer.stop()
+            self.filter_table(self.filter_input.text())
+        # Geschrieben wird blockweise direkt aus den Ergebnisdaten, ohne Kopie der ganzen Tabelle.
+        gesamt = self.model.rowCount()
+        job, neu = self.jobs.submit(("export", path), export_result, self.model.chunks(CHUNK_ZEILEN), path, gesamt)
+        if neu:
+            job.signals.progress.connect(self.show_progress)
+            job.signals.finished.connect(lambda zeilen: self.job_ended(f"{zeilen} Zeilen exportiert: {path}"))
+            job.signals.failed.connect(lambda e: self.job_ended(f"Fehler beim Export: {e}"))
+            job.signals.cancelled.connect(lambda: self.job_ended("Export abgebrochen."))
+            self.update_cancel_button()
 
     def filter_table(self, text):
-        text = text.strip().lower()
-        for row in range(self.tabelle.rowCount()):
-            match = False
-            for col in range(self.tabelle.columnCount()):
-                item = self.tabelle.item(row, col)
-                if item and text in item.text().lower():
-                    match = True
-                    break
-            self.tabelle.setRowHidden(row, not match)
+        self.model.set_filter(text)
 
     def download_extract_and_map(self, url):
-        self.excel_upload_btn.setEnabled(True)
-        if not self.plz_shapefile:
-            self.download_label.setText("PLZ-Shapefile nicht gefunden. Bitte zuerst PLZ-Daten laden.")
+        min_anteil = self.anteil_spinbox.value() / 100 if self.anteil_checkbox.isChecked() else None
+        self.aktive_wahl = (url, min_anteil)
+        job, neu = self.jobs.submit(("wahl", url, min_anteil), mit_filter, prepare_wahl, url, self.lookup_store, min_anteil, self.wk_archiv)
+        if neu:
+            job.signals.progress.connect(self.show_progress)
+            job.signals.finished.connect(self.wahl_ready)
+            job.signals.failed.connect(lambda e: self.job_ended(f"Fehler beim Mapping: {e}"))
+            job.signals.cancelled.connect(lambda: self.job_ended("Vorgang abgebrochen."))
+            self.update_cancel_button()
+
+    def wahl_ready(self, fertig):
+        ergebnis, filter_index = fertig
+        if (ergebnis["url"], ergebnis["min_anteil"]) != self.aktive_wahl:
+            self.job_ended(f"Vorbereitet: {ergebnis['url']}")
             return
 
-        self.download_label.setText("Lade Wahlkreisdaten...")
-        local_filename = os.path.join(tempfile.gettempdir(), os.path.basename(url))
-        extract_path = os.path.join(tempfile.gettempdir(), os.path.splitext(os.path.basename(url))[0])
-
-        try:
-            if not os.path.exists(local_filename):
-                with requests.get(url, stream=True) as r:
-                    r.raise_for_status()
-                    with open(local_filename, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-
-            with zipfile.ZipFile(local_filename, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
-
-            self.wk_shapefile = None
-            for root, dirs, files in os.walk(extract_path):
-                for file in files:
-                    if file.endswith(".shp"):
-                        self.wk_shapefile = os.path.join(root, file)
-                        break
-
-            if not self.wk_shapefile:
-                self.download_label.setText("Keine Shapefile in ZIP gefunden.")
-                return
-
-            self.download_label.setText("Verarbeite Geodaten...")
-
-            gdf_plz = gpd.read_file(self.plz_shapefile).to_crs("EPSG:25832")
-            gdf_wk = gpd.read_file(self.wk_shapefile).to_crs("EPSG:25832")
-
-            gdf_joined = gpd.sjoin(gdf_plz, gdf_wk, how="inner", predicate="intersects")
-
-            wk_spalten = [col for col in gdf_joined.columns if col.lower() in ["wknr", "wkr_nr", "nummer", "wahlkreis", "wkr"] or col.lower().startswith("wk")]
-
-            if not wk_spalten:
-                raise ValueError(f"Keine geeignete Wahlkreis-Spalte gefunden. Verfügbare Spalten: {list(gdf_joined.columns)}")
-
-            wkr_spalte = wk_spalten[0]
-            result_df = gdf_joined[["plz", wkr_spalte, "note", "einwohner", "qkm"]].drop_duplicates()
-
-            self.tabelle.setRowCount(len(result_df))
-            self.tabelle.setColumnCount(5)
-            self.tabelle.setHorizontalHeaderLabels(["PLZ", "Wahlkreis", "Hinweis", "Einwohner", "Fläche (qkm)"])
-
-            for row in range(self.tabelle.rowCount()):
-                widget = self.tabelle.cellWidget(row, 2)
-                if widget and widget.property("removable"):
-                    self.tabelle.removeCellWidget(row, 2)
-            for i, row in result_df.iterrows():
-                self.tabelle.setItem(i, 0, QTableWidgetItem(str(row["plz"])))
-                self.tabelle.setItem(i, 1, QTableWidgetItem(str(row[wkr_spalte])))
-                self.tabelle.setItem(i, 2, QTableWidgetItem(str(row.get("note", ""))))
-                self.tabelle.setItem(i, 3, QTableWidgetItem(str(row.get("einwohner", ""))))
-                self.tabelle.setItem(i, 4, QTableWidgetItem(str(row.get("qkm", ""))))
-
-                self.download_label.setText("Mapping abgeschlossen.")
-                self.filter_input.show()
-
-            self.back_button.show()
+        self.plz_archiv = ergebnis["plz_archiv"]
+        self.wk_archiv = ergebnis["wk_archiv"]
+        self.excel_upload_btn.setEnabled(True)
 
-        except Exception as e:
-            self.download_label.setText(f"Fehler beim Mapping: {e}")
+        if ergebnis["min_anteil"] is None:
+            headers = ["PLZ", "Wahlkreis", "Hinweis", "Einwohner", "Fläche (qkm)"]
+        else:
+            headers = ["PLZ", "Wahlkreis", "Anteil", "Hauptwahlkreis", "Hinweis", "Einwohner", "Fläche (qkm)"]
+        self.show_result(ergebnis["result_df"], headers, filter_index)
+        if ergebnis["bericht"] is not None:
+            self.job_ended(f"Mapping abgeschlossen. {len(ergebnis['bericht'])} PLZ gegenüber der vorherigen Wahl geändert.")
+        else:
+            self.job_ended("Mapping abgeschlossen.")
+        self.filter_input.show()
+        self.back_button.show()
+        self.resize_to_table(80, 450)
+
+    def map_all_elections(self):
+        links = [(jahr, url) for jahr, url in self.links if DOWNLOAD_REGEX.search(url)]
+        if not links:
+            QMessageBox.warning(self, "Keine Wahlen", "Es wurden noch keine Wahlkreis-Shapefiles gefunden.")
+            return
 
-        self.tabelle.resizeColumnsToContents()
-        total_width = sum([self.tabelle.columnWidth(i) for i in range(self.tabelle.columnCount())])
-        self.resize(total_width + 80, self.tabelle.sizeHint().height() + 450)
+        job, neu = self.jobs.submit("batch", mit_filter, prepare_batch, links)
+        if neu:
+            job.signals.progress.connect(self.show_progress)
+            job.signals.finished.connect(self.batch_ready)
+            job.signals.failed.connect(lambda e: self.job_ended(f"Fehler beim Mapping: {e}"))
+            job.signals.cancelled.connect(lambda: self.job_ended("Vorgang abgebrochen."))
+            self.update_cancel_button()
+
+    def batch_ready(self, ergebnis):
+        result_df, filter_index = ergebnis
+        jahre = list(result_df.columns[1:-3])
+        self.show_result(result_df, ["PLZ"] + jahre + ["Hinweis", "Einwohner", "Fläche (qkm)"], filter_index)
+        self.job_ended(f"{len(jahre)} Wahlen zugeordnet.")
+        self.filter_input.show()
+        self.back_button.show()
+        self.resize_to_table(80, 450)
 
     def load_and_map_shapefiles(self):
-        if not self.plz_shapefile:
+        if not self.plz_archiv:
             self.download_label.setText("PLZ-Shapefile nicht gefunden. Bitte zuerst PLZ-Daten laden.")
             return
 
@@ -472,31 +474,24 @@ class DownloaderApp(QMainWindow):
         if not shp_path:
             return
 
-        self.download_label.setText("Lade und verarbeite Shapefiles...")
-
-        try:
-            gdf_plz = gpd.read_file(self.plz_shapefile).to_crs("EPSG:25832")
-            gdf_wk = gpd.read_file(shp_path).to_crs("EPSG:25832")
-
-            gdf_joined = gpd.sjoin(gdf_plz, gdf_wk, how="inner", predicate="intersects")
-            result_df = gdf_joined[["plz", "WKNR"]].drop_duplicates()
+        job, neu = self.jobs.submit(("shapefile", shp_path), mit_filter, map_shapefiles, self.plz_archiv, shp_path)
+        if neu:
+            job.signals.progress.connect(self.show_progress)
+            job.signals.finished.connect(self.shapefiles_mapped)
+            job.signals.failed.connect(lambda e: self.job_ended(f"Fehler beim Mapping: {e}"))
+            job.signals.cancelled.connect(lambda: self.job_ended("Mapping abgebrochen."))
+            self.update_cancel_button()
 
-            self.tabelle.setRowCount(len(result_df))
-            self.tabelle.setColumnCount(2)
-            self.tabelle.setHorizontalHeaderLabels(["PLZ", "Wahlkreis"])
-            for i, row in result_df.iterrows():
-                self.tabelle.setItem(i, 0, QTableWidgetItem(str(row["plz"])))
-                self.tabelle.setItem(i, 1, QTableWidgetItem(str(row["WKNR"])))
-
-            self.download_label.setText("Mapping abgeschlossen.")
-        except Exception as e:
-            self.download_label.setText(f"Fehler beim Mapping: {e}")
+    def shapefiles_mapped(self, ergebnis):
+        result_df, filter_index = ergebnis
+        self.show_result(result_df, ["PLZ", "Wahlkreis"], filter_index)
+        self.job_ended("Mapping abgeschlossen.")
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
 
     splash = SplashScreen()
-    splash.show()
 
     def show_main_window(links):
         global hauptfenster
@@ -504,9 +499,14 @@ if __name__ == '__main__':
         hauptfenster = DownloaderApp(links)
         hauptfenster.show()
 
-
     scraper = ScraperThread()
-    scraper.finished.connect(lambda links: show_main_window(links))
+    gespeicherte_links = links_from_manifest(load_manifest())
+    if gespeicherte_links:
+        show_main_window(gespeicherte_links)
+        scraper.finished.connect(lambda links: hauptfenster.set_links(links))
+    else:
+        splash.show()
+        scraper.finished.connect(lambda links: show_main_window(links))
     scraper.start()
 
     sys.exit(app.exec())
@@ -10,25 +10,24 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter', 'matplotlib'],
     noarchive=False,
     optimize=0,
 )
 pyz = PYZ(a.pure)
 
+# Als Ordner statt als Einzeldatei bauen: eine Einzeldatei entpackt bei jedem Start
+# alle Bibliotheken (GDAL, PROJ, Qt, Arrow) in ein temporäres Verzeichnis.
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='PLZ2WK',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +35,12 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='PLZ2WK',
+)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# Ungefähre Ausdehnung Deutschlands in EPSG:4326, damit auch die Umprojektion realistisch ist.
+BBOX = (5.9, 47.3, 15.0, 55.1)
+PLZ_ANZAHL = 8200
+WK_ANZAHL = 299
+# Realistische Gebiete haben viele Stützpunkte; Voronoi-Zellen werden deshalb verdichtet.
+SEGMENT_LAENGE = 0.01
+CHUNK_ZEILEN = 1_000_000
+
+
+def voronoi_zellen(anzahl, seed, segment_laenge=SEGMENT_LAENGE):
+    rng = np.random.default_rng(seed)
+    punkte = shapely.points(rng.uniform(BBOX[0], BBOX[2], anzahl), rng.uniform(BBOX[1], BBOX[3], anzahl))
+    rahmen = shapely.box(*BBOX)
+    zellen = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(punkte), extend_to=rahmen))
+    return shapely.segmentize(shapely.intersection(zellen, rahmen), segment_laenge)
+
+
+def plz_layer(anzahl=PLZ_ANZAHL, seed=1):
+    zellen = voronoi_zellen(anzahl, seed)
+    plz = [f"{code:05d}" for code in np.linspace(1067, 99998, len(zellen)).astype(int)]
+    rng = np.random.default_rng(seed)
+    return gpd.GeoDataFrame(
+        {
+            "plz": plz,
+            "note": [f"{code} Ort" for code in plz],
+            "einwohner": rng.integers(100, 60_000, len(zellen)),
+            "qkm": np.round(rng.uniform(1, 300, len(zellen)), 3),
+        },
+        geometry=zellen,
+        crs="EPSG:4326",
+    )
+
+
+def wk_layer(anzahl=WK_ANZAHL, seed=2):
+    zellen = voronoi_zellen(anzahl, seed)
+    nummern = np.arange(1, len(zellen) + 1)
+    return gpd.GeoDataFrame(
+        {"WKR_NR": nummern, "WKR_NAME": [f"Wahlkreis {nr}" for nr in nummern], "LAND_NR": nummern % 16 + 1},
+        geometry=zellen,
+        crs="EPSG:4326",
+    )
+
+
+def write_zip(gdf, name, ziel):
+    pfad = os.path.join(ziel, f"{name}.zip")
+    if os.path.exists(pfad):
+        return pfad
+    with tempfile.TemporaryDirectory() as tmp:
+        gdf.to_file(os.path.join(tmp, f"{name}.shp"))
+        with zipfile.ZipFile(f"{pfad}.tmp", "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            for datei in sorted(os.listdir(tmp)):
+                zip_ref.write(os.path.join(tmp, datei), f"{name}/{datei}")
+    os.replace(f"{pfad}.tmp", pfad)
+    return pfad
+
+
+def write_waehlerliste(pfad, zeilen, plz_werte, seed=3):
+    if os.path.exists(pfad):
+        return pfad
+    rng = np.random.default_rng(seed)
+    # Ein kleiner Teil ungültiger PLZ, wie in echten Listen.
+    plz_werte = np.append(plz_werte, ["00000", "1067", ""])
+    with open(f"{pfad}.tmp", "w", encoding="utf-8", newline="") as f:
+        for start in range(0, zeilen, CHUNK_ZEILEN):
+            anzahl = min(CHUNK_ZEILEN, zeilen - start)
+            pd.DataFrame({
+                "Name": pd.Series(np.arange(start, start + anzahl)).astype(str).radd("Person "),
+                "PLZ": rng.choice(plz_werte, anzahl),
+            }).to_csv(f, index=False, header=start == 0)
+    os.replace(f"{pfad}.tmp", pfad)
+    return pfad
+
+
+def prepare_fixtures(ziel, zeilen_liste):
+    os.makedirs(ziel, exist_ok=True)
+    gdf_plz = plz_layer()
+    plz_archiv = write_zip(gdf_plz, "plz", ziel)
+    wk_archiv = write_zip(wk_layer(), "wahlkreise", ziel)
+    listen = {
+        zeilen: write_waehlerliste(os.path.join(ziel, f"waehler_{zeilen}.csv"), zeilen, gdf_plz["plz"].to_numpy())
+        for zeilen in zeilen_liste
+    }
+    return plz_archiv, wk_archiv, listen
@@ -0,0 +1,200 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from .fixtures import prepare_fixtures
+
+# wkmapper liest PLZ2WK_CACHE beim Import; die Module werden deshalb erst nach dem Umstellen in main() geladen.
+BENCHMARK_CACHE = os.path.join(tempfile.gettempdir(), "plz2wk-benchmark")
+STANDARD_ZEILEN = [10_000, 100_000, 1_000_000]
+SICHTBARE_ZEILEN = 50
+ERGEBNIS_DIR = os.path.join(os.path.dirname(__file__), "ergebnisse")
+
+
+class Lauf:
+    def __init__(self, wiederholungen):
+        self.wiederholungen = wiederholungen
+        self.ergebnisse = []
+
+    def messen(self, stufe, func, *args, zeilen=None):
+        from wkmapper.instrumentation import Speicherspitze, rss_bytes
+
+        zeiten, spitzen = [], []
+        for _ in range(self.wiederholungen):
+            gc.collect()
+            with Speicherspitze() as speicher:
+                start = time.perf_counter()
+                ergebnis = func(*args)
+                zeiten.append(time.perf_counter() - start)
+            spitzen.append(speicher.spitze - speicher.start)
+
+        eintrag = {
+            "stufe": stufe,
+            "zeilen": zeilen,
+            "sekunden": round(min(zeiten), 6),
+            "sekunden_median": round(sorted(zeiten)[len(zeiten) // 2], 6),
+            "speicher_zuwachs_mb": round(max(spitzen) / 2**20, 1),
+            "rss_mb": round(rss_bytes() / 2**20, 1),
+        }
+        if zeilen is None and hasattr(ergebnis, "__len__"):
+            eintrag["zeilen"] = len(ergebnis)
+        self.ergebnisse.append(eintrag)
+        print(f"{stufe:<22} {eintrag['zeilen'] or '':>10} {eintrag['sekunden']:>9.3f} s {eintrag['speicher_zuwachs_mb']:>8.1f} MB")
+        return ergebnis
+
+
+def tabellenmodell():
+    try:
+        from wkmapper.tablemodel import DataFrameModel
+    except ImportError:
+        return None
+    return DataFrameModel
+
+
+def fill_table(df):
+    model = tabellenmodell()(df)
+    # Wie beim Anzeigen: sichtbare Zellen abfragen, dann einmal sortieren und filtern.
+    for zeile in range(min(SICHTBARE_ZEILEN, model.rowCount())):
+        for spalte in range(model.columnCount()):
+            model.data(model.index(zeile, spalte))
+    model.sort(0)
+    model.set_filter("1")
+    return model
+
+
+def bench_geodaten(lauf, plz_archiv, wk_archiv, ziel):
+    import geopandas as gpd
+
+    from wkmapper.config import ZIEL_CRS
+    from wkmapper.export import write_table
+    from wkmapper.geodata import GEODATEN_DIR, PLZ_ATTRIBUTE, load_plz, load_wahlkreise, read_layer
+    from wkmapper.mapping import ERGEBNIS_SPALTEN, overlap_plz_wahlkreise
+
+    gdf_plz = lauf.messen("lesen_plz", read_layer, plz_archiv, PLZ_ATTRIBUTE)
+    gdf_wk = lauf.messen("lesen_wk", read_layer, wk_archiv, ["WKR_NR"])
+    gdf_plz = lauf.messen("reprojizieren_plz", gdf_plz.to_crs, ZIEL_CRS)
+    gdf_wk = lauf.messen("reprojizieren_wk", gdf_wk.to_crs, ZIEL_CRS).rename(columns={"WKR_NR": "wahlkreis"})
+
+    # Wie join_plz_wahlkreise, aber mit getrennt gemessenem Join und Deduplizieren.
+    gdf_joined = lauf.messen("sjoin", gpd.sjoin, gdf_plz, gdf_wk, "inner", "intersects")
+    result_df = lauf.messen("dedupe", lambda: gdf_joined[ERGEBNIS_SPALTEN].drop_duplicates().reset_index(drop=True))
+    lauf.messen("flaechenanteile", overlap_plz_wahlkreise, gdf_plz, gdf_wk, 0.01)
+
+    def geoparquet_schreiben():
+        shutil.rmtree(GEODATEN_DIR, ignore_errors=True)
+        load_wahlkreise(wk_archiv)
+        return load_plz(plz_archiv)
+
+    lauf.messen("geoparquet_schreiben", geoparquet_schreiben)
+    lauf.messen("geoparquet_lesen", load_plz, plz_archiv)
+
+    if tabellenmodell():
+        lauf.messen("tabelle_fuellen", fill_table, result_df, zeilen=len(result_df))
+    lauf.messen("export", write_table, result_df, os.path.join(ziel, "export_tabelle.csv"), zeilen=len(result_df))
+    lauf.messen("export_parquet", write_table, result_df, os.path.join(ziel, "export_tabelle.parquet"), zeilen=len(result_df))
+
+
+def bench_upload(lauf, plz_archiv, wk_archiv, pfad, zeilen, ziel):
+    from wkmapper.export import write_table
+    from wkmapper.mapping import apply_lookup, build_lookup, make_index
+    from wkmapper.pipeline import read_table
+
+    df = lauf.messen("liste_lesen", read_table, pfad, zeilen=zeilen)
+    df = df.rename(columns={"PLZ": "plz"})
+    plz_werte = df["plz"].astype(str).str.lower().unique()
+    lookup = lauf.messen("lookup_bauen", lambda: make_index(build_lookup(plz_archiv, wk_archiv, plz_werte)), zeilen=zeilen)
+    merged = lauf.messen("zuordnen", apply_lookup, df, lookup, zeilen=zeilen)
+    if tabellenmodell():
+        lauf.messen("tabelle_fuellen", fill_table, merged, zeilen=zeilen)
+    lauf.messen("export", write_table, merged, os.path.join(ziel, "export_upload.csv"), zeilen=zeilen)
+    lauf.messen("export_parquet", write_table, merged, os.path.join(ziel, "export_upload.parquet"), zeilen=zeilen)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def vergleichen(alt_pfad, neu_pfad, schwelle):
+    with open(alt_pfad, encoding="utf-8") as f:
+        alt = {(e["stufe"], e["zeilen"]): e for e in json.load(f)["ergebnisse"]}
+    with open(neu_pfad, encoding="utf-8") as f:
+        neu = json.load(f)["ergebnisse"]
+
+    langsamer = 0
+    print(f"{'Stufe':<22} {'Zeilen':>10} {'alt (s)':>9} {'neu (s)':>9} {'Faktor':>7}")
+    for eintrag in neu:
+        vorher = alt.get((eintrag["stufe"], eintrag["zeilen"]))
+        if not vorher:
+            continue
+        faktor = eintrag["sekunden"] / max(vorher["sekunden"], 1e-9)
+        markierung = " !" if faktor > 1 + schwelle else ""
+        langsamer += bool(markierung)
+        print(f"{eintrag['stufe']:<22} {eintrag['zeilen'] or '':>10} {vorher['sekunden']:>9.3f} {eintrag['sekunden']:>9.3f} {faktor:>7.2f}{markierung}")
+    return 1 if langsamer else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description="Laufzeit und Speicher der Verarbeitungsschritte messen")
+    parser.add_argument("--zeilen", type=int, nargs="+", default=STANDARD_ZEILEN, help="Größen der Wählerlisten")
+    parser.add_argument("--wiederholungen", type=int, default=1, help="Läufe je Stufe; gemeldet wird die schnellste Zeit")
+    parser.add_argument("--daten", default=os.path.join(BENCHMARK_CACHE, "fixtures"), help="Verzeichnis für die erzeugten Testdaten")
+    parser.add_argument("--ausgabe", help="JSON-Datei für die Ergebnisse (Standard: benchmarks/ergebnisse/<commit>-<zeit>.json)")
+    parser.add_argument("--vergleich", nargs=2, metavar=("ALT", "NEU"), help="Zwei Ergebnisdateien vergleichen statt zu messen")
+    parser.add_argument("--schwelle", type=float, default=0.1, help="Ab diesem Anteil gilt eine Stufe beim Vergleich als langsamer")
+    args = parser.parse_args(argv)
+
+    if args.vergleich:
+        return vergleichen(*args.vergleich, args.schwelle)
+
+    # Eigener Cache, damit Messläufe den Cache der Anwendung weder benutzen noch verändern.
+    # Auch ein gesetztes PLZ2WK_CACHE wird überschrieben, da die Messung dort GeoParquet-Kopien löscht.
+    os.environ["PLZ2WK_CACHE"] = BENCHMARK_CACHE
+    from wkmapper.config import CACHE_DIR
+
+    if os.path.abspath(CACHE_DIR) != os.path.abspath(BENCHMARK_CACHE):
+        raise SystemExit(f"wkmapper wurde vor den Benchmarks importiert und nutzt den Cache {CACHE_DIR}; Abbruch.")
+    plz_archiv, wk_archiv, listen = prepare_fixtures(args.daten, args.zeilen)
+    lauf = Lauf(args.wiederholungen)
+    with tempfile.TemporaryDirectory() as ziel:
+        bench_geodaten(lauf, plz_archiv, wk_archiv, ziel)
+        for zeilen, pfad in sorted(listen.items()):
+            bench_upload(lauf, plz_archiv, wk_archiv, pfad, zeilen, ziel)
+
+    commit = git_commit()
+    ausgabe = args.ausgabe or os.path.join(ERGEBNIS_DIR, f"{commit or 'unbekannt'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(ausgabe)), exist_ok=True)
+    with open(ausgabe, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "commit": commit,
+                "zeit": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "plattform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "wiederholungen": args.wiederholungen,
+            },
+            "ergebnisse": lauf.ergebnisse,
+        }, f, indent=1)
+    print(f"Ergebnisse gespeichert: {ausgabe}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import io
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wkmapper.downloads import DownloadCache
+
+
+def _zip_bytes():
+    puffer = io.BytesIO()
+    with zipfile.ZipFile(puffer, "w") as zip_ref:
+        zip_ref.writestr("wahlkreise.shp", b"x" * 200_000)
+    return puffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    inhalte = {"/archiv.zip": _zip_bytes(), "/fehler.zip": b"<html>Wartungsarbeiten</html>"}
+
+    def do_GET(self):
+        body = self.inhalte[self.path]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # Langsam senden, damit sich gleichzeitige Abrufe überschneiden.
+        for i in range(0, len(body), 20_000):
+            self.wfile.write(body[i:i + 20_000])
+            time.sleep(0.01)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def basis():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_gleichzeitiger_abruf(basis, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    with ThreadPoolExecutor(4) as executor:
+        pfade = list(executor.map(lambda _: cache.fetch(f"{basis}/archiv.zip"), range(4)))
+    assert len(set(pfade)) == 1
+    with open(pfade[0], "rb") as f:
+        assert f.read() == Handler.inhalte["/archiv.zip"]
+
+
+def test_fehlerseite_wird_nicht_gespeichert(basis, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    with pytest.raises(ValueError):
+        cache.fetch(f"{basis}/fehler.zip")
+    assert cache.lookup(f"{basis}/fehler.zip") is None
@@ -0,0 +1,78 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wkmapper import scraper
+
+SEITE = '<a href="/dateien/btw{}_geometrie_wahlkreise_vg250_geo_shp.zip">Download</a>'
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Jahr -> HTTP-Status der Seite; 200 liefert eine Seite mit einem Download-Link.
+    status = {}
+
+    def do_GET(self):
+        jahr = int(self.path.strip("/").split("/")[0])
+        status = self.status.get(jahr, 404)
+        if status == 200 and self.headers.get("If-None-Match") == f'"{jahr}"':
+            status = 304
+        body = SEITE.format(jahr).encode() if status == 200 else b"<html>Wartungsarbeiten</html>"
+        self.send_response(status)
+        if status == 200:
+            self.send_header("ETag", f'"{jahr}"')
+        self.send_header("Content-Length", str(len(body) if status != 304 else 0))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(scraper, "BASIS_URL", f"http://127.0.0.1:{httpd.server_port}/{{}}/downloads.html")
+    monkeypatch.setattr(scraper, "save_manifest", lambda manifest: None)
+    Handler.status = {2021: 200, 2025: 200}
+    yield Handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_nur_angefragte_jahre(server):
+    manifest = {"seiten": {}}
+    scraper.scrape_all([2021, 2025], manifest=manifest)
+    links = scraper.scrape_all([2025], manifest=manifest)
+    assert [jahr for jahr, _ in links] == [2025]
+
+
+def test_304_behaelt_eintrag(server):
+    manifest = {"seiten": {}}
+    scraper.scrape_all([2021], manifest=manifest)
+    alt = manifest["seiten"]["2021"]
+    links = scraper.scrape_all([2021], manifest=manifest)
+    assert manifest["seiten"]["2021"] is alt
+    assert links == [(2021, alt["links"][0])]
+
+
+def test_404_ohne_wahl(server):
+    manifest = {"seiten": {}}
+    assert scraper.scrape_all([2022], manifest=manifest) == []
+    assert manifest["seiten"]["2022"]["links"] == []
+
+
+@pytest.mark.parametrize("status", [500, 503])
+def test_serverfehler_behaelt_eintrag(server, status):
+    manifest = {"seiten": {}}
+    scraper.scrape_all([2021], manifest=manifest)
+    alt = manifest["seiten"]["2021"]
+    server.status[2021] = status
+    gemeldet = []
+    links = scraper.scrape_all([2021], manifest=manifest, on_page=lambda url, ok: gemeldet.append(ok))
+    assert manifest["seiten"]["2021"] == alt
+    assert [jahr for jahr, _ in links] == [2021]
+    assert gemeldet == [False]
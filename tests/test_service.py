@@ -0,0 +1,33 @@
+import asyncio
+
+import pandas as pd
+
+from wkmapper.plzindex import PlzIndex
+from wkmapper.service import LookupService
+
+
+async def _senden(anfragen):
+    service = LookupService({"2025": PlzIndex.from_frame(pd.DataFrame({"plz": ["01067"], "wahlkreis": [5]}))})
+    server = await asyncio.start_server(service.handle, "127.0.0.1", 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(anfragen)
+        await writer.drain()
+        antwort = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+    return antwort.decode("latin-1")
+
+
+def test_keep_alive():
+    antwort = asyncio.run(_senden(b"GET /lookup?plz=01067 HTTP/1.1\r\n\r\nGET /health HTTP/1.1\r\nConnection: close\r\n\r\n"))
+    assert antwort.count("HTTP/1.1 200 OK") == 2
+
+
+def test_ungueltige_laenge_schliesst_verbindung():
+    body = b"GET /health HTTP/1.1\r\n\r\n"
+    antwort = asyncio.run(_senden(
+        b"POST /lookup HTTP/1.1\r\nContent-Length: abc\r\n\r\n" + body
+    ))
+    assert antwort.startswith("HTTP/1.1 400 Bad Request")
+    assert "Connection: close" in antwort
+    assert antwort.count("HTTP/1.1") == 1
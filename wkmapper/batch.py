@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .geodata import geoparquet_pfad, load_plz, load_wahlkreise
+from .instrumentation import verfuegbar_bytes
+from .partition import SPEICHER_FAKTOR, _koordinaten_bytes, _lesen
+
+MAX_PROZESSE = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+# Bei ein oder zwei Wahlen kostet der Start der Prozesse mehr, als sie einsparen.
+MIN_PARALLEL = 3
+# Grundbedarf eines gestarteten Prozesses mit GeoPandas, GDAL und Arrow.
+PROZESS_BYTES = 200 * 2**20
+
+_gdf_plz = None
+
+
+def _laden(art, quelle, laden):
+    # Die Prozesse lesen nur die GeoParquet-Kopien, die der Elternprozess angelegt hat, und fassen den Cache-Index nicht an.
+    pfad = geoparquet_pfad(art, quelle)
+    return _lesen([pfad]) if pfad else laden(quelle)
+
+
+def _init_worker(plz_archiv):
+    global _gdf_plz
+    _gdf_plz = _laden("plz", plz_archiv, load_plz)
+
+
+def plz_paare(gdf_plz, gdf_wk):
+    wk_idx, plz_idx = gdf_plz.sindex.query(gdf_wk.geometry.values, predicate="intersects")
+    paare = pd.DataFrame({
+        "plz": gdf_plz["plz"].to_numpy()[plz_idx],
+        "wahlkreis": gdf_wk["wahlkreis"].to_numpy()[wk_idx],
+    })
+    return paare.drop_duplicates().reset_index(drop=True)
+
+
+def _map_edition(wk_archiv):
+    return plz_paare(_gdf_plz, _laden("wk", wk_archiv, load_wahlkreise))
+
+
+def wide_table(gdf_plz, paare_je_wahl):
+    tabelle = gdf_plz.drop_duplicates("plz")[["plz", "note", "einwohner", "qkm"]].set_index("plz")
+    for spalte, paare in paare_je_wahl.items():
+        # PLZ, die mehrere Wahlkreise schneiden, bekommen alle Nummern in einer Zelle.
+        paare = paare.sort_values(["plz", "wahlkreis"])
+        tabelle[str(spalte)] = paare["wahlkreis"].astype(str).groupby(paare["plz"]).agg(", ".join)
+    tabelle = tabelle.sort_index().reset_index()
+    return tabelle[["plz"] + [str(spalte) for spalte in paare_je_wahl] + ["note", "einwohner", "qkm"]]
+
+
+def prozesse_fuer_speicher(gdf_plz, max_prozesse):
+    # Geometrien und Index liegen in jedem Prozess einzeln; nur so viele starten, wie in den freien Speicher passen.
+    frei = verfuegbar_bytes()
+    if not frei:
+        return max_prozesse
+    je_prozess = PROZESS_BYTES + SPEICHER_FAKTOR * _koordinaten_bytes(gdf_plz)
+    return max(1, min(max_prozesse, int(frei // je_prozess)))
+
+
+def map_editionen(plz_archiv, wk_archive, max_prozesse=None, on_done=None):
+    # Erzeugt bei Bedarf die GeoParquet-Kopie, bevor die Prozesse sie lesen.
+    gdf_plz = load_plz(plz_archiv)
+    max_prozesse = max(1, min(max_prozesse or MAX_PROZESSE, MAX_PROZESSE, len(wk_archive)))
+    if len(wk_archive) < MIN_PARALLEL:
+        max_prozesse = 1
+    else:
+        max_prozesse = prozesse_fuer_speicher(gdf_plz, max_prozesse)
+    ergebnisse = {}
+
+    if max_prozesse == 1:
+        for spalte, wk_archiv in wk_archive.items():
+            ergebnisse[spalte] = plz_paare(gdf_plz, load_wahlkreise(wk_archiv))
+            if on_done:
+                on_done(len(ergebnisse), len(wk_archive))
+    else:
+        # Alle Kopien und Einträge im Cache-Index entstehen hier, bevor die Prozesse starten.
+        for wk_archiv in wk_archive.values():
+            load_wahlkreise(wk_archiv)
+        # "spawn" statt fork: der Aufrufer hat oft schon Qt- und Arbeits-Threads laufen.
+        executor = ProcessPoolExecutor(
+            max_prozesse,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(plz_archiv,),
+        )
+        try:
+            futures = {executor.submit(_map_edition, wk_archiv): spalte for spalte, wk_archiv in wk_archive.items()}
+            for future in as_completed(futures):
+                ergebnisse[futures[future]] = future.result()
+                if on_done:
+                    on_done(len(ergebnisse), len(wk_archive))
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    return wide_table(gdf_plz, {spalte: ergebnisse[spalte] for spalte in wk_archive})
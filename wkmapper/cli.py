@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import os
+import time
+
+import pandas as pd
+
+from .batch import map_editionen
+from .config import CHUNK_ZEILEN, JOIN_SPEICHER_MB, MIN_ANTEIL, PLZ_URL
+from .diff import diff_archive
+from .downloads import download
+from .export import ChunkWriter, write_table
+from .geodata import load_wahlkreise
+from .instrumentation import aktivieren
+from .mapping import build_lookup, find_koordinaten_spalten, find_plz_spalte, make_index, map_chunk, map_plz_to_wahlkreise
+from .pipeline import fetch_editionen, prepare_index
+from .plzindex import PlzIndex
+from .scraper import scrape_all, scrape_links
+from .service import LookupService, serve
+from .store import LookupStore
+
+
+def read_chunks(pfad, chunksize):
+    endung = os.path.splitext(pfad)[1].lower()
+    if endung == ".csv":
+        yield from pd.read_csv(pfad, dtype=str, chunksize=chunksize)
+    elif endung == ".xlsx":
+        from openpyxl import load_workbook
+
+        wb = load_workbook(pfad, read_only=True)
+        try:
+            zeilen = wb.active.iter_rows(values_only=True)
+            header = [str(col) for col in next(zeilen)]
+            batch = []
+            for zeile in zeilen:
+                batch.append([None if wert is None else str(wert) for wert in zeile[:len(header)]])
+                if len(batch) >= chunksize:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            wb.close()
+    else:
+        df = pd.read_excel(pfad, dtype=str)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def resolve_wk_archiv(jahr):
+    url, links = scrape_links(jahr)
+    if not links:
+        raise SystemExit(f"Keine Wahlkreis-Shapefiles für {jahr} gefunden ({url}).")
+    return download(links[0][1])
+
+
+def map_file(eingabe, ausgabe, plz_archiv, wk_archiv, chunksize=CHUNK_ZEILEN, index=None):
+    lookup = index or make_index(build_lookup(plz_archiv, wk_archiv))
+    gdf_wk = load_wahlkreise(wk_archiv) if wk_archiv else None
+    zeilen = 0
+    with ChunkWriter(ausgabe) as writer:
+        for chunk in read_chunks(eingabe, chunksize):
+            plz_spalte = find_plz_spalte(chunk.columns)
+            koordinaten = find_koordinaten_spalten(chunk.columns)
+            if not plz_spalte and not koordinaten:
+                raise SystemExit("Die Datei muss eine Spalte namens 'plz' oder 'Postleitzahl' oder Koordinatenspalten enthalten.")
+            if koordinaten and gdf_wk is None:
+                raise SystemExit("Für Koordinaten wird ein Wahlkreis-Shapefile benötigt (--wahl oder --wk-archiv).")
+            if plz_spalte:
+                chunk = chunk.rename(columns={plz_spalte: "plz"})
+            writer.write(map_chunk(chunk, lookup, gdf_wk, koordinaten))
+            zeilen += len(chunk)
+    return zeilen
+
+
+def cmd_map(args):
+    if args.index:
+        index, plz_archiv, wk_archiv = PlzIndex.load(args.index), None, None
+    else:
+        index = None
+        plz_archiv = args.plz_archiv or download(PLZ_URL)
+        wk_archiv = args.wk_archiv or resolve_wk_archiv(args.wahl)
+
+    start = time.perf_counter()
+    zeilen = map_file(args.eingabe, args.ausgabe, plz_archiv, wk_archiv, args.chunksize, index)
+    dauer = time.perf_counter() - start
+    print(f"{zeilen} Zeilen in {dauer:.1f} s zugeordnet ({zeilen / max(dauer, 1e-9):,.0f} Zeilen/s).")
+
+
+def cmd_tabelle(args):
+    plz_archiv = args.plz_archiv or download(PLZ_URL)
+    wk_archiv = args.wk_archiv or resolve_wk_archiv(args.wahl)
+
+    start = time.perf_counter()
+    min_anteil = args.min_anteil if args.flaechenanteile else None
+    result_df = map_plz_to_wahlkreise(plz_archiv, wk_archiv, min_anteil, args.speicher, args.prozesse)
+    write_table(result_df, args.ausgabe)
+    dauer = time.perf_counter() - start
+    print(f"{len(result_df)} PLZ-Wahlkreis-Paare in {dauer:.1f} s berechnet.")
+
+
+def cmd_batch(args):
+    plz_archiv = args.plz_archiv or download(PLZ_URL)
+    if args.wk_archiv:
+        wk_archive = {os.path.splitext(os.path.basename(pfad))[0]: pfad for pfad in args.wk_archiv}
+    else:
+        links = scrape_all(args.wahl)
+        if not links:
+            raise SystemExit("Keine Wahlkreis-Shapefiles gefunden.")
+        wk_archive = fetch_editionen(links)
+
+    start = time.perf_counter()
+    result_df = map_editionen(
+        plz_archiv,
+        wk_archive,
+        args.prozesse,
+        on_done=lambda fertig, gesamt: print(f"{fertig}/{gesamt} Wahlen zugeordnet."),
+    )
+    write_table(result_df, args.ausgabe)
+    dauer = time.perf_counter() - start
+    print(f"{len(result_df)} PLZ für {len(wk_archive)} Wahlen in {dauer:.1f} s zugeordnet.")
+
+
+def cmd_diff(args):
+    plz_archiv = args.plz_archiv or download(PLZ_URL)
+    wk_alt = args.alt_archiv or resolve_wk_archiv(args.alt)
+    wk_neu = args.neu_archiv or resolve_wk_archiv(args.neu)
+
+    start = time.perf_counter()
+    neu_df, bericht, geprueft = diff_archive(plz_archiv, wk_alt, wk_neu, LookupStore())
+    write_table(bericht, args.ausgabe)
+    if args.tabelle:
+        write_table(neu_df, args.tabelle)
+    dauer = time.perf_counter() - start
+    print(f"{geprueft} PLZ neu geprüft, {len(bericht)} geändert ({dauer:.1f} s).")
+
+
+def cmd_index(args):
+    plz_archiv = args.plz_archiv or download(PLZ_URL)
+    wk_archiv = args.wk_archiv or resolve_wk_archiv(args.wahl)
+
+    min_anteil = args.min_anteil if args.flaechenanteile else None
+    index = PlzIndex.from_frame(map_plz_to_wahlkreise(plz_archiv, wk_archiv, min_anteil, args.speicher, args.prozesse))
+    index.save(args.ausgabe)
+    print(f"PLZ-Index mit {len(index.ueberlauf_plz)} geteilten PLZ geschrieben ({os.path.getsize(args.ausgabe) / 1024:.0f} KB).")
+
+
+def print_stage(text, percent=-1):
+    if percent < 0:
+        print(text)
+
+
+def cmd_serve(args):
+    indizes = {}
+    for angabe in args.index or []:
+        wahl, _, pfad = angabe.partition("=")
+        if not pfad:
+            raise SystemExit("--index erwartet WAHL=DATEI, z.B. 2025=btw2025.plzidx")
+        indizes[wahl] = PlzIndex.load(pfad)
+
+    if args.wahl or not indizes:
+        store = LookupStore()
+        for jahr, url in scrape_all(args.wahl):
+            if str(jahr) not in indizes:
+                indizes[str(jahr)] = prepare_index(url, store, stage=print_stage)
+    if not indizes:
+        raise SystemExit("Keine Wahlkreis-Shapefiles gefunden.")
+
+    try:
+        asyncio.run(serve(LookupService(indizes), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def add_speicher(parser):
+    parser.add_argument("--speicher", type=int, default=JOIN_SPEICHER_MB, help="Speicherbudget in MB; zerlegt den Join in Kacheln (Standard: ohne Zerlegung)")
+    parser.add_argument("--prozesse", type=int, help="Höchstzahl paralleler Prozesse für die Kacheln (Standard: alle Kerne)")
+
+
+def add_quellen(parser, index=False):
+    wahl = parser.add_mutually_exclusive_group(required=True)
+    wahl.add_argument("--election", "--wahl", dest="wahl", type=int, help="Wahljahr, z.B. 2025")
+    wahl.add_argument("--wk-archiv", help="Lokales ZIP mit Wahlkreis-Shapefile")
+    if index:
+        wahl.add_argument("--index", help="Mit 'index' erzeugte PLZ-Index-Datei statt der Geodaten verwenden")
+    parser.add_argument("--plz-archiv", help="Lokales ZIP mit PLZ-Shapefile")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="wkmapper", description="Wahlkreis-PLZ-Mapper ohne Oberfläche")
+    parser.add_argument("--profil", action="store_true", help="Laufzeit und Speicher je Schritt als JSON auf stderr protokollieren")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+
+    map_parser = sub.add_parser("map", help="Datei mit Postleitzahlen Wahlkreisen zuordnen")
+    map_parser.add_argument("eingabe", help="CSV- oder Excel-Datei mit einer Spalte 'plz' oder 'Postleitzahl'")
+    map_parser.add_argument("ausgabe", help="Zieldatei (.csv, .csv.gz, .parquet oder .xlsx)")
+    add_quellen(map_parser, index=True)
+    map_parser.add_argument("--chunksize", type=int, default=CHUNK_ZEILEN, help="Zeilen pro Block")
+    map_parser.set_defaults(func=cmd_map)
+
+    tabelle_parser = sub.add_parser("tabelle", help="PLZ-Wahlkreis-Tabelle einer Wahl schreiben")
+    tabelle_parser.add_argument("ausgabe", help="Zieldatei (.csv, .csv.gz, .parquet oder .xlsx)")
+    add_quellen(tabelle_parser)
+    tabelle_parser.add_argument("--flaechenanteile", action="store_true", help="Flächenanteile je PLZ und Wahlkreis berechnen")
+    tabelle_parser.add_argument("--min-anteil", type=float, default=MIN_ANTEIL, help="Mindestanteil für Randgebiete (0-1)")
+    add_speicher(tabelle_parser)
+    tabelle_parser.set_defaults(func=cmd_tabelle)
+
+    batch_parser = sub.add_parser("batch", help="PLZ-Tabelle mit einer Spalte je Wahl schreiben")
+    batch_parser.add_argument("ausgabe", help="Zieldatei (.csv, .csv.gz, .parquet oder .xlsx)")
+    quellen = batch_parser.add_mutually_exclusive_group()
+    quellen.add_argument("--election", "--wahl", dest="wahl", type=int, action="append", help="Wahljahr, mehrfach angebbar (Standard: alle)")
+    quellen.add_argument("--wk-archiv", action="append", help="Lokales ZIP mit Wahlkreis-Shapefile, mehrfach angebbar")
+    batch_parser.add_argument("--plz-archiv", help="Lokales ZIP mit PLZ-Shapefile")
+    batch_parser.add_argument("--prozesse", type=int, help="Anzahl paralleler Prozesse (Standard: alle Kerne)")
+    batch_parser.set_defaults(func=cmd_batch)
+
+    index_parser = sub.add_parser("index", help="Kompakten PLZ-Index einer Wahl schreiben")
+    index_parser.add_argument("ausgabe", help="Zieldatei für den Index")
+    add_quellen(index_parser)
+    index_parser.add_argument("--flaechenanteile", action="store_true", help="Hauptwahlkreis nach Flächenanteil bestimmen")
+    index_parser.add_argument("--min-anteil", type=float, default=MIN_ANTEIL, help="Mindestanteil für Randgebiete (0-1)")
+    add_speicher(index_parser)
+    index_parser.set_defaults(func=cmd_index)
+
+    serve_parser = sub.add_parser("serve", help="PLZ-Abfragedienst über HTTP starten")
+    serve_parser.add_argument("--election", "--wahl", dest="wahl", type=int, action="append", help="Wahljahr, mehrfach angebbar (Standard: alle)")
+    serve_parser.add_argument("--index", action="append", help="Fertiger PLZ-Index als WAHL=DATEI, mehrfach angebbar")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Adresse, an die der Dienst gebunden wird")
+    serve_parser.add_argument("--port", type=int, default=8000, help="Port des Dienstes")
+    serve_parser.set_defaults(func=cmd_serve)
+
+    diff_parser = sub.add_parser("diff", help="Geänderte PLZ-Zuordnungen zwischen zwei Wahlen auflisten")
+    diff_parser.add_argument("ausgabe", help="Zieldatei für den Änderungsbericht (.csv, .csv.gz, .parquet oder .xlsx)")
+    for name in ("alt", "neu"):
+        gruppe = diff_parser.add_mutually_exclusive_group(required=True)
+        gruppe.add_argument(f"--{name}", type=int, help=f"Wahljahr der {name}en Einteilung")
+        gruppe.add_argument(f"--{name}-archiv", help=f"Lokales ZIP mit der {name}en Einteilung")
+    diff_parser.add_argument("--plz-archiv", help="Lokales ZIP mit PLZ-Shapefile")
+    diff_parser.add_argument("--tabelle", help="Vollständige neue Zuordnung zusätzlich in diese Datei schreiben")
+    diff_parser.set_defaults(func=cmd_diff)
+
+    args = parser.parse_args(argv)
+    if args.profil:
+        aktivieren()
+    args.func(args)
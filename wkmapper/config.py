@@ -0,0 +1,28 @@
+import os
+import re
+import tempfile
+from datetime import datetime
+
+STARTJAHR = 2017
+AKTUELLES_JAHR = datetime.now().year
+BASIS_URL = "https://www.bundeswahlleiterin.de/bundestagswahlen/{}/wahlkreiseinteilung/downloads.html"
+DOWNLOAD_REGEX = re.compile(r"geometrie_wahlkreise_vg250_(geo_shp|shp_geo)\.zip", re.IGNORECASE)
+PLZ_URL = "https://services2.arcgis.com/jUpNdisbWqRpMo35/arcgis/rest/services/PLZ_Gebiete/FeatureServer/replicafilescache/PLZ_Gebiete_-6414732440474739110.zip"
+
+CACHE_DIR = os.environ.get("PLZ2WK_CACHE", os.path.join(tempfile.gettempdir(), "plz2wk"))
+
+ZIEL_CRS = "EPSG:25832"
+
+STORE_MAX_BYTES = 256 * 1024 * 1024
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get("PLZ2WK_CACHE_MAX_MB", 2048)) * 1024 * 1024
+
+CHUNK_ZEILEN = 100_000
+
+MIN_ANTEIL = 0.01
+# Ab einem Wert > 0 (MB) wird der PLZ-Wahlkreis-Join in Kacheln zerlegt, die jeweils in dieses Budget passen.
+JOIN_SPEICHER_MB = int(os.environ.get("PLZ2WK_JOIN_SPEICHER_MB", 0))
+FILTER_VERZOEGERUNG_MS = 200
+
+# Messwerte je Verarbeitungsschritt als JSON-Zeilen protokollieren (ohne Datei auf stderr).
+PROFIL_AKTIV = os.environ.get("PLZ2WK_PROFIL", "") not in ("", "0")
+PROFIL_DATEI = os.environ.get("PLZ2WK_PROFIL_DATEI")
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from .geodata import load_plz, load_wahlkreise
+from .mapping import ERGEBNIS_SPALTEN, join_plz_wahlkreise
+
+BERICHT_SPALTEN = ["plz", "wahlkreise_alt", "wahlkreise_neu", "aenderung", "dazu", "weg"]
+
+
+def _signaturen(gdf_wk):
+    import shapely
+
+    # Gleiche Fläche mit anderer Stützpunkt-Reihenfolge soll nicht als Änderung gelten.
+    wkb = shapely.to_wkb(shapely.normalize(gdf_wk.geometry.values))
+    return pd.Series(list(zip(gdf_wk["wahlkreis"].to_numpy(), wkb)))
+
+
+def changed_wahlkreise(gdf_alt, gdf_neu):
+    sig_alt = _signaturen(gdf_alt)
+    sig_neu = _signaturen(gdf_neu)
+    weg = ~sig_alt.isin(set(sig_neu)).to_numpy()
+    neu = ~sig_neu.isin(set(sig_alt)).to_numpy()
+    return gdf_alt[weg], gdf_neu[neu]
+
+
+def affected_plz(gdf_plz, geaenderte):
+    # Nur Bounding-Boxen vergleichen; die genaue Prüfung übernimmt der Join auf der Teilmenge.
+    _, plz_idx = gdf_plz.sindex.query(geaenderte, predicate=None)
+    return np.unique(gdf_plz["plz"].to_numpy()[plz_idx])
+
+
+def _wahlkreis_listen(result_df):
+    paare = result_df[["plz", "wahlkreis"]].drop_duplicates().sort_values(["plz", "wahlkreis"])
+    return paare["wahlkreis"].astype(str).groupby(paare["plz"]).agg(", ".join)
+
+
+def _nummer(wahlkreis):
+    return (0, int(wahlkreis), "") if wahlkreis.isdigit() else (1, 0, wahlkreis)
+
+
+def change_report(alt_df, neu_df, plz_werte):
+    alt = _wahlkreis_listen(alt_df[alt_df["plz"].isin(plz_werte)])
+    neu = _wahlkreis_listen(neu_df[neu_df["plz"].isin(plz_werte)])
+    bericht = pd.DataFrame({"wahlkreise_alt": alt, "wahlkreise_neu": neu})
+    bericht = bericht[bericht["wahlkreise_alt"].fillna("") != bericht["wahlkreise_neu"].fillna("")]
+    bericht["aenderung"] = np.select(
+        [bericht["wahlkreise_alt"].isna(), bericht["wahlkreise_neu"].isna()],
+        ["hinzugekommen", "weggefallen"],
+        "verschoben",
+    )
+    alt_mengen = bericht["wahlkreise_alt"].fillna("").str.split(", ").map(set)
+    neu_mengen = bericht["wahlkreise_neu"].fillna("").str.split(", ").map(set)
+    bericht["dazu"] = [", ".join(sorted(n - a - {""}, key=_nummer)) for a, n in zip(alt_mengen, neu_mengen)]
+    bericht["weg"] = [", ".join(sorted(a - n - {""}, key=_nummer)) for a, n in zip(alt_mengen, neu_mengen)]
+    bericht.index.name = "plz"
+    return bericht.sort_index().reset_index()[BERICHT_SPALTEN]
+
+
+def diff_editionen(gdf_plz, gdf_alt, gdf_neu, alt_df=None):
+    if alt_df is None:
+        alt_df = join_plz_wahlkreise(gdf_plz, gdf_alt)
+
+    weg, neu = changed_wahlkreise(gdf_alt, gdf_neu)
+    geaenderte = np.concatenate([weg.geometry.values, neu.geometry.values])
+    plz_werte = affected_plz(gdf_plz, geaenderte) if len(geaenderte) else np.array([], dtype=object)
+
+    # Alle übrigen PLZ schneiden in beiden Ausgaben nur unveränderte Wahlkreise.
+    neu_berechnet = join_plz_wahlkreise(gdf_plz[gdf_plz["plz"].isin(plz_werte)], gdf_neu)
+    neu_df = pd.concat([alt_df[~alt_df["plz"].isin(plz_werte)], neu_berechnet], ignore_index=True)
+    neu_df = neu_df[ERGEBNIS_SPALTEN].sort_values(["plz", "wahlkreis"], kind="stable").reset_index(drop=True)
+    return neu_df, change_report(alt_df, neu_df, plz_werte), len(plz_werte)
+
+
+def diff_archive(plz_archiv, wk_alt, wk_neu, store=None, alt_df=None):
+    gdf_plz = load_plz(plz_archiv)
+    gdf_alt = load_wahlkreise(wk_alt)
+    gdf_neu = load_wahlkreise(wk_neu)
+
+    if alt_df is None and store is not None:
+        alt_schluessel = store.key_for(plz_archiv, wk_alt)
+        alt_df = store.get(alt_schluessel)
+        if alt_df is None:
+            alt_df = join_plz_wahlkreise(gdf_plz, gdf_alt)
+            store.put(alt_schluessel, alt_df)
+
+    neu_df, bericht, neu_geprueft = diff_editionen(gdf_plz, gdf_alt, gdf_neu, alt_df)
+    if store is not None:
+        store.put(store.key_for(plz_archiv, wk_neu), neu_df)
+    return neu_df, bericht, neu_geprueft
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+
+from .config import CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES
+from .instrumentation import stufe
+
+CHUNK_BYTES = 64 * 1024
+
+
+def file_hash(pfad, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(pfad, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _ordner_groesse(pfad):
+    return sum(os.path.getsize(os.path.join(root, file)) for root, dirs, files in os.walk(pfad) for file in files)
+
+
+def _zip_fehler(pfad):
+    try:
+        with zipfile.ZipFile(pfad) as zip_ref:
+            defekt = zip_ref.testzip()
+    except (zipfile.BadZipFile, EOFError) as e:
+        return str(e)
+    return f"{defekt} ist beschädigt" if defekt else None
+
+
+class DownloadCache:
+    def __init__(self, verzeichnis=None, max_bytes=DOWNLOAD_CACHE_MAX_BYTES):
+        self.verzeichnis = verzeichnis or os.path.join(CACHE_DIR, "downloads")
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(self.verzeichnis, "objekte")
+        self.partial_dir = os.path.join(self.verzeichnis, "teile")
+        self.index_pfad = os.path.join(self.verzeichnis, "index.json")
+        for pfad in (self.blob_dir, self.partial_dir):
+            os.makedirs(pfad, exist_ok=True)
+        self._lock = threading.RLock()
+        self._session = None
+        self._hashes = {}
+        self._url_locks = {}
+
+    def _load_index(self):
+        try:
+            with open(self.index_pfad, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"urls": {}, "objekte": {}}
+
+    def _save_index(self, index):
+        tmp = f"{self.index_pfad}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, self.index_pfad)
+
+    def _blob_pfad(self, sha):
+        return os.path.join(self.blob_dir, f"{sha}.zip")
+
+    def _touch(self, sha, **felder):
+        with self._lock:
+            index = self._load_index()
+            objekt = index["objekte"].setdefault(sha, {})
+            objekt.update(felder)
+            objekt["zuletzt"] = time.time()
+            self._save_index(index)
+
+    def lookup(self, url):
+        with self._lock:
+            sha = self._load_index()["urls"].get(url)
+        if sha and os.path.exists(self._blob_pfad(sha)):
+            return self._blob_pfad(sha)
+        return None
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def fetch(self, url, sha256=None, progress=None, refresh=False):
+        # Jobs mit verschiedenen Schlüsseln können dieselbe URL anfordern; die .part-Datei gehört immer nur einem.
+        with self._url_lock(url):
+            return self._fetch(url, sha256, progress, refresh)
+
+    def _fetch(self, url, sha256, progress, refresh):
+        if not refresh:
+            pfad = self.lookup(url)
+            if pfad and (not sha256 or os.path.basename(pfad) == f"{sha256}.zip"):
+                self._touch(os.path.basename(pfad)[:-4])
+                return pfad
+
+        part = os.path.join(self.partial_dir, hashlib.sha256(url.encode()).hexdigest() + ".part")
+        with stufe("download", url=url) as s:
+            total = self._download_part(url, part, progress)
+            s.zaehlen(bytes=os.path.getsize(part))
+        if total and os.path.getsize(part) != total:
+            raise IOError(f"Download unvollständig: {os.path.getsize(part)} von {total} Bytes")
+
+        # Eine Fehlerseite mit Status 200 darf nicht dauerhaft unter der URL landen.
+        fehler = _zip_fehler(part)
+        if fehler:
+            os.remove(part)
+            raise ValueError(f"{url} lieferte kein gültiges ZIP-Archiv: {fehler}")
+
+        sha = file_hash(part)
+        if sha256 and sha != sha256:
+            os.remove(part)
+            raise ValueError(f"Prüfsumme von {url} stimmt nicht: {sha} statt {sha256}")
+
+        blob = self._blob_pfad(sha)
+        os.replace(part, blob)
+        with self._lock:
+            index = self._load_index()
+            index["urls"][url] = sha
+            index["objekte"].setdefault(sha, {}).update({"bytes": os.path.getsize(blob), "zuletzt": time.time()})
+            self._save_index(index)
+        self.evict(behalten=sha)
+        return blob
+
+    @property
+    def session(self):
+        # requests erst beim ersten Download importieren.
+        with self._lock:
+            if self._session is None:
+                import requests
+
+                self._session = requests.Session()
+            return self._session
+
+    def _download_part(self, url, part, progress):
+        vorhanden = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={vorhanden}-"} if vorhanden else {}
+
+        with self.session.get(url, stream=True, headers=headers, timeout=(10, 60)) as r:
+            if r.status_code == 416:
+                os.remove(part)
+                return self._download_part(url, part, progress)
+            r.raise_for_status()
+
+            if r.status_code == 206:
+                modus = "ab"
+            else:
+                vorhanden = 0
+                modus = "wb"
+            laenge = int(r.headers.get("content-length", 0))
+            total = vorhanden + laenge if laenge else 0
+            downloaded = vorhanden
+            with open(part, modus) as f:
+                for chunk in r.iter_content(chunk_size=CHUNK_BYTES):
+                    if chunk:
+                        f.write(chunk)
+                        downloaded += len(chunk)
+                        if progress and total > 0:
+                            progress(int(downloaded * 100 / total))
+        return total
+
+    def content_hash(self, archiv):
+        name = os.path.basename(archiv)
+        if os.path.dirname(os.path.abspath(archiv)) == os.path.abspath(self.blob_dir) and name.endswith(".zip"):
+            return name[:-4]
+        st = os.stat(archiv)
+        schluessel = (os.path.abspath(archiv), st.st_size, st.st_mtime_ns)
+        if schluessel not in self._hashes:
+            self._hashes[schluessel] = file_hash(archiv)
+        return self._hashes[schluessel]
+
+    def add_derived(self, archiv, pfad):
+        # Aus einem Archiv erzeugte Dateien (GeoParquet, Kacheln) zählen zu dessen Eintrag und werden mit ihm verdrängt.
+        sha = self.content_hash(archiv)
+        groesse = _ordner_groesse(pfad) if os.path.isdir(pfad) else os.path.getsize(pfad)
+        with self._lock:
+            index = self._load_index()
+            objekt = index["objekte"].setdefault(sha, {})
+            objekt.setdefault("abgeleitet", {})[os.path.abspath(pfad)] = groesse
+            objekt["zuletzt"] = time.time()
+            self._save_index(index)
+        self.evict(behalten=sha)
+
+    def use(self, archiv):
+        self._touch(self.content_hash(archiv))
+
+    def evict(self, behalten=None):
+        with self._lock:
+            index = self._load_index()
+            objekte = sorted(index["objekte"].items(), key=lambda item: item[1].get("zuletzt", 0), reverse=True)
+            belegt = 0
+            for sha, objekt in objekte:
+                groesse = objekt.get("bytes", 0) + sum(objekt.get("abgeleitet", {}).values())
+                if sha == behalten or belegt + groesse <= self.max_bytes:
+                    belegt += groesse
+                    continue
+                self._remove(index, sha)
+            self._save_index(index)
+
+    def clear(self):
+        with self._lock:
+            index = self._load_index()
+            for sha in list(index["objekte"]):
+                self._remove(index, sha)
+            self._save_index(index)
+            shutil.rmtree(self.partial_dir, ignore_errors=True)
+            os.makedirs(self.partial_dir, exist_ok=True)
+
+    def _remove(self, index, sha):
+        if os.path.exists(self._blob_pfad(sha)):
+            os.remove(self._blob_pfad(sha))
+        for pfad in index["objekte"].get(sha, {}).get("abgeleitet", {}):
+            if os.path.isdir(pfad):
+                shutil.rmtree(pfad, ignore_errors=True)
+            elif os.path.exists(pfad):
+                os.remove(pfad)
+        index["objekte"].pop(sha, None)
+        index["urls"] = {url: wert for url, wert in index["urls"].items() if wert != sha}
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = DownloadCache()
+        return _default_cache
+
+
+def download(url, progress=None):
+    return default_cache().fetch(url, progress=progress)
@@ -0,0 +1,165 @@
+import bz2
+import functools
+import gzip
+import lzma
+import os
+
+import numpy as np
+
+from .instrumentation import stufe
+
+CSV_KOMPRIMIERUNG = {
+    "gzip": functools.partial(gzip.open, compresslevel=6),
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+KOMPRIMIERUNG_ENDUNGEN = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+PARQUET_KOMPRIMIERUNG = "zstd"
+XLSX_MAX_ZEILEN = 1_048_576
+EXPORT_FILTER = {
+    "CSV-Dateien (*.csv)": ".csv",
+    "CSV, gzip-komprimiert (*.csv.gz)": ".csv.gz",
+    "Parquet-Dateien (*.parquet)": ".parquet",
+    "Excel-Dateien (*.xlsx)": ".xlsx",
+}
+
+
+def export_format(pfad):
+    basis, endung = os.path.splitext(pfad.lower())
+    komprimierung = KOMPRIMIERUNG_ENDUNGEN.get(endung)
+    if komprimierung:
+        endung = os.path.splitext(basis)[1]
+    return (endung[1:] if endung in (".parquet", ".xlsx") else "csv"), komprimierung
+
+
+def _als_text(df):
+    # Parquet braucht einen Typ je Spalte; gemischte Object-Spalten werden daher als Text geschrieben.
+    spalten = np.flatnonzero((df.dtypes == object).to_numpy())
+    if not len(spalten):
+        return df
+    df = df.copy()
+    for i in spalten:
+        werte = df.iloc[:, i]
+        df.isetitem(i, werte.astype(str).where(werte.notna(), None))
+    return df
+
+
+class ChunkWriter:
+    def __init__(self, pfad, komprimierung=None):
+        self.pfad = pfad
+        self.format, endung_komprimierung = export_format(pfad)
+        self.komprimierung = komprimierung or endung_komprimierung
+        # Erst nach vollständigem Schreiben umbenennen, damit kein halber Export liegen bleibt.
+        self.tmp = f"{pfad}.{os.getpid()}.tmp"
+        self.header_geschrieben = False
+        self.zeilen = 0
+
+        if self.format == "xlsx":
+            if self.komprimierung:
+                raise ValueError("XLSX-Dateien sind bereits komprimiert.")
+            from openpyxl import Workbook
+
+            self.wb = Workbook(write_only=True)
+            self.ws = None
+        elif self.format == "parquet":
+            self.parquet = None
+        else:
+            if self.komprimierung and self.komprimierung not in CSV_KOMPRIMIERUNG:
+                raise ValueError(f"Unbekannte Komprimierung für CSV: {self.komprimierung}")
+            oeffnen = CSV_KOMPRIMIERUNG.get(self.komprimierung, open)
+            self.f = oeffnen(self.tmp, "wt", newline="", encoding="utf-8")
+
+    def write(self, df):
+        if self.format == "xlsx":
+            self._write_xlsx(df)
+        elif self.format == "parquet":
+            self._write_parquet(df)
+        else:
+            df.to_csv(self.f, index=False, header=not self.header_geschrieben)
+        self.header_geschrieben = True
+        self.zeilen += len(df)
+
+    def _neues_blatt(self):
+        # Ein Excel-Blatt fasst gut eine Million Zeilen; größere Exporte gehen auf weitere Blätter.
+        self.ws = self.wb.create_sheet(f"Ergebnisse {len(self.wb.worksheets) + 1}" if self.wb.worksheets else "Ergebnisse")
+        self.ws.append(self.spalten)
+        self.blatt_zeilen = 1
+
+    def _write_xlsx(self, df):
+        if not self.header_geschrieben:
+            self.spalten = [str(spalte) for spalte in df.columns]
+            self._neues_blatt()
+        for zeile in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+            if self.blatt_zeilen >= XLSX_MAX_ZEILEN:
+                self._neues_blatt()
+            self.ws.append(zeile)
+            self.blatt_zeilen += 1
+
+    def _write_parquet(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.parquet is None:
+            tabelle = pa.Table.from_pandas(_als_text(df), preserve_index=False)
+            # Spalten ohne Werte im ersten Block haben noch keinen Typ; sie werden als Text angelegt.
+            self.schema = pa.schema(
+                [feld.with_type(pa.large_string()) if pa.types.is_null(feld.type) else feld for feld in tabelle.schema],
+                metadata=tabelle.schema.metadata,
+            )
+            self.parquet = pq.ParquetWriter(self.tmp, self.schema, compression=self.komprimierung or PARQUET_KOMPRIMIERUNG)
+            tabelle = tabelle.cast(self.schema)
+        else:
+            tabelle = pa.Table.from_pandas(_als_text(df), schema=self.schema, preserve_index=False)
+        self.parquet.write_table(tabelle)
+
+    def _schliessen(self):
+        if self.format == "xlsx":
+            if self.ws is None:
+                self.wb.create_sheet("Ergebnisse")
+            self.wb.save(self.tmp)
+        elif self.format == "parquet":
+            if self.parquet is None:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                pq.write_table(pa.table({}), self.tmp)
+            else:
+                self.parquet.close()
+        else:
+            self.f.close()
+
+    def close(self):
+        self._schliessen()
+        os.replace(self.tmp, self.pfad)
+
+    def abort(self):
+        try:
+            self._schliessen()
+        finally:
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, fehler, tb):
+        if typ is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def write_table(df, pfad, komprimierung=None):
+    with ChunkWriter(pfad, komprimierung) as writer:
+        writer.write(df)
+
+
+def write_chunks(chunks, pfad, komprimierung=None, on_chunk=None):
+    with stufe("export", datei=os.path.basename(pfad)) as s, ChunkWriter(pfad, komprimierung) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+            if on_chunk:
+                on_chunk(writer.zeilen)
+        s.zaehlen(zeilen=writer.zeilen)
+    return writer.zeilen
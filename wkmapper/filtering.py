@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+
+def display_text(series):
+    return series.astype(object).where(series.notna(), "").astype(str)
+
+
+def _find_spalte(df, name):
+    return next((col for col in df.columns if str(col).lower() == name), None)
+
+
+class FilterIndex:
+    def __init__(self, df):
+        self._df = df
+        self._texte = None
+        self._plz = None
+        self._wahlkreise = None
+        self._letzte_anfrage = None
+        self._letzte_spalten = None
+        self._letzte_zeilen = None
+
+    def vorbereiten(self):
+        # Alle Indizes auf einmal bauen, im Hintergrund-Job statt beim ersten Tastendruck in der Oberfläche.
+        self._text_index()
+        self._plz_index()
+        self._wahlkreis_index()
+        return self
+
+    def _text_index(self):
+        if self._texte is None:
+            self._texte = [display_text(self._df[col]).str.lower() for col in self._df.columns]
+        return self._texte
+
+    def _plz_index(self):
+        spalte = _find_spalte(self._df, "plz")
+        if spalte is None:
+            return None
+        if self._plz is None:
+            werte = display_text(self._df[spalte]).str.lower().to_numpy(dtype=str)
+            reihenfolge = np.argsort(werte, kind="stable")
+            self._plz = (werte[reihenfolge], reihenfolge)
+        return self._plz
+
+    def _wahlkreis_index(self):
+        spalte = _find_spalte(self._df, "wahlkreis")
+        if spalte is None:
+            return None
+        if self._wahlkreise is None:
+            werte = pd.to_numeric(self._df[spalte], errors="coerce").to_numpy(dtype=float)
+            reihenfolge = np.argsort(werte, kind="stable")
+            self._wahlkreise = (werte[reihenfolge], reihenfolge)
+        return self._wahlkreise
+
+    def match(self, text):
+        text = text.strip().lower()
+        if not text:
+            self._letzte_anfrage = self._letzte_zeilen = None
+            return None
+
+        # Nur ASCII-Ziffern: "²" gilt für isdigit() auch als Ziffer, aber nicht für int().
+        if text.isascii() and text.isdigit():
+            maske = self._match_nummer(text)
+            if maske is not None:
+                # Zahlen in den übrigen Spalten (z.B. Wahlkreise je Wahljahr) weiterhin als Teilstring finden.
+                maske[self._match_text(text, self._ungeindexte_spalten())] = True
+                return maske
+
+        maske = np.zeros(len(self._df), dtype=bool)
+        maske[self._match_text(text)] = True
+        return maske
+
+    def _match_nummer(self, text):
+        plz_index = self._plz_index()
+        wk_index = self._wahlkreis_index()
+        if plz_index is None and wk_index is None:
+            return None
+
+        maske = np.zeros(len(self._df), dtype=bool)
+        if plz_index is not None:
+            werte, reihenfolge = plz_index
+            von = np.searchsorted(werte, text, side="left")
+            bis = np.searchsorted(werte, text + "\U0010ffff", side="left")
+            maske[reihenfolge[von:bis]] = True
+        if wk_index is not None:
+            werte, reihenfolge = wk_index
+            von = np.searchsorted(werte, int(text), side="left")
+            bis = np.searchsorted(werte, int(text), side="right")
+            maske[reihenfolge[von:bis]] = True
+        return maske
+
+    def _ungeindexte_spalten(self):
+        geindext = {_find_spalte(self._df, "plz"), _find_spalte(self._df, "wahlkreis")}
+        return [i for i, col in enumerate(self._df.columns) if col not in geindext]
+
+    def _match_text(self, text, spalten=None):
+        # Eine längere Eingabe kann nur Zeilen treffen, die schon die kürzere in denselben Spalten getroffen haben.
+        if self._letzte_anfrage and text.startswith(self._letzte_anfrage) and spalten == self._letzte_spalten:
+            kandidaten = self._letzte_zeilen
+        else:
+            kandidaten = np.arange(len(self._df))
+
+        texte = self._text_index()
+        if spalten is not None:
+            texte = [texte[i] for i in spalten]
+        treffer = np.zeros(len(kandidaten), dtype=bool)
+        for spalte in texte:
+            offen = ~treffer
+            if not offen.any():
+                break
+            teil = spalte.iloc[kandidaten[offen]]
+            treffer[offen] = teil.str.contains(text, regex=False).to_numpy()
+
+        self._letzte_anfrage = text
+        self._letzte_spalten = spalten
+        self._letzte_zeilen = kandidaten[treffer]
+        return self._letzte_zeilen
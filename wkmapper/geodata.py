@@ -0,0 +1,149 @@
+import os
+import threading
+import zipfile
+
+from .config import CACHE_DIR, ZIEL_CRS
+from .downloads import default_cache
+from .instrumentation import stufe
+
+WK_SPALTEN = ["wknr", "wkr_nr", "nummer", "wahlkreis", "wkr"]
+GEODATEN_DIR = os.path.join(CACHE_DIR, "geodaten")
+PLZ_ATTRIBUTE = ["plz", "note", "einwohner", "qkm"]
+# Bei Änderungen an Spaltenauswahl oder Aufbereitung erhöhen, damit alte Parquet-Dateien neu erzeugt werden.
+GEODATEN_VERSION = 2
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def find_wk_spalte(columns):
+    wk_spalten = [col for col in columns if col.lower() in WK_SPALTEN or col.lower().startswith("wk")]
+    return wk_spalten[0] if wk_spalten else None
+
+
+def layer_path(quelle):
+    if not quelle.lower().endswith(".zip"):
+        return quelle
+    with zipfile.ZipFile(quelle) as zip_ref:
+        shp_dateien = sorted(name for name in zip_ref.namelist() if name.lower().endswith(".shp"))
+    if not shp_dateien:
+        raise ValueError("Keine Shapefile in ZIP gefunden.")
+    return f"/vsizip/{os.path.abspath(quelle)}/{shp_dateien[0]}"
+
+
+def read_layer(quelle, columns=None):
+    # GeoPandas und GDAL brauchen beim Import spürbar Zeit und werden daher erst hier geladen.
+    import geopandas as gpd
+
+    with stufe("lesen", quelle=os.path.basename(quelle)) as s:
+        gdf = gpd.read_file(layer_path(quelle), columns=columns, engine="pyogrio", use_arrow=True)
+        s.zaehlen(geometrien=len(gdf))
+    return gdf
+
+
+def read_batches(quelle, columns, batch_size):
+    import geopandas as gpd
+    import pyarrow as pa
+    import pyogrio
+
+    # Blockweise lesen, damit nie die ganze Ebene gleichzeitig im Speicher liegt.
+    with pyogrio.open_arrow(layer_path(quelle), columns=columns, batch_size=batch_size, use_pyarrow=True) as (_, reader):
+        for batch in reader:
+            gdf = gpd.GeoDataFrame.from_arrow(pa.Table.from_batches([batch]))
+            if gdf.geometry.name != "geometry":
+                gdf = gdf.rename_geometry("geometry")
+            yield gdf
+
+
+def reproject(gdf):
+    with stufe("umprojizieren", geometrien=len(gdf)):
+        return gdf.to_crs(ZIEL_CRS)
+
+
+def _reparieren(gdf):
+    import shapely
+
+    # Selbstüberschneidende Polygone lassen Verschneidungen mit TopologyException scheitern und haben falsche Flächen.
+    geometrien = gdf.geometry.values
+    ungueltig = ~shapely.is_valid(geometrien)
+    if ungueltig.any():
+        gdf.loc[ungueltig, gdf.geometry.name] = shapely.make_valid(geometrien[ungueltig], method="structure", keep_collapsed=False)
+    return gdf
+
+
+def _plz_bereinigen(gdf_plz):
+    gdf_plz["plz"] = gdf_plz["plz"].astype(str).str.lower()
+    return gdf_plz
+
+
+def _prepare_plz(quelle):
+    return _plz_bereinigen(_reparieren(reproject(read_layer(quelle, PLZ_ATTRIBUTE))))
+
+
+def wk_spalte(quelle):
+    import pyogrio
+
+    felder = list(pyogrio.read_info(layer_path(quelle))["fields"])
+    wkr_spalte = find_wk_spalte(felder)
+    if not wkr_spalte:
+        raise ValueError(f"Keine geeignete Wahlkreis-Spalte gefunden. Verfügbare Spalten: {felder}")
+    return wkr_spalte
+
+
+def _prepare_wahlkreise(quelle):
+    wkr_spalte = wk_spalte(quelle)
+    gdf_wk = _reparieren(reproject(read_layer(quelle, [wkr_spalte])))
+    return gdf_wk.rename(columns={wkr_spalte: "wahlkreis"})
+
+
+def iter_plz(quelle, batch_size):
+    for gdf in read_batches(quelle, PLZ_ATTRIBUTE, batch_size):
+        yield _plz_bereinigen(_reparieren(reproject(gdf)))
+
+
+def iter_wahlkreise(quelle, batch_size):
+    wkr_spalte = wk_spalte(quelle)
+    for gdf in read_batches(quelle, [wkr_spalte], batch_size):
+        yield _reparieren(reproject(gdf)).rename(columns={wkr_spalte: "wahlkreis"})
+
+
+def geoparquet_pfad(art, quelle):
+    # Nur ZIP-Archive bekommen eine GeoParquet-Kopie; lose Shapefiles werden direkt gelesen.
+    if not quelle.lower().endswith(".zip"):
+        return None
+    return os.path.join(GEODATEN_DIR, f"{art}_v{GEODATEN_VERSION}_{default_cache().content_hash(quelle)}.parquet")
+
+
+def _cached(art, quelle, prepare):
+    pfad = geoparquet_pfad(art, quelle)
+    if pfad is None:
+        return prepare(quelle)
+
+    cache = default_cache()
+    with _locks_lock:
+        lock = _locks.setdefault(pfad, threading.Lock())
+    with lock:
+        if os.path.exists(pfad):
+            import geopandas as gpd
+
+            with stufe("geoparquet_lesen", art=art) as s:
+                gdf = gpd.read_parquet(pfad, memory_map=True)
+                s.zaehlen(geometrien=len(gdf))
+            cache.use(quelle)
+            return gdf
+
+        gdf = prepare(quelle)
+        os.makedirs(GEODATEN_DIR, exist_ok=True)
+        tmp = f"{pfad}.{os.getpid()}.{threading.get_ident()}.tmp"
+        gdf.to_parquet(tmp, index=False)
+        os.replace(tmp, pfad)
+        cache.add_derived(quelle, pfad)
+        return gdf
+
+
+def load_plz(quelle):
+    return _cached("plz", quelle, _prepare_plz)
+
+
+def load_wahlkreise(quelle):
+    return _cached("wk", quelle, _prepare_wahlkreise)
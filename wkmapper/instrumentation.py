@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import PROFIL_AKTIV, PROFIL_DATEI
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ABTASTUNG_S = 0.005
+
+logger = logging.getLogger("wkmapper.stufen")
+
+_aktiv = PROFIL_AKTIV
+_handler = None
+_lokal = threading.local()
+
+
+def rss_bytes():
+    if psutil:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def verfuegbar_bytes():
+    if psutil:
+        return psutil.virtual_memory().available
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+class Speicherspitze:
+    def __init__(self):
+        self.start = self.spitze = 0
+        self._stopp = threading.Event()
+
+    def __enter__(self):
+        self.start = self.spitze = rss_bytes()
+        self._thread = threading.Thread(target=self._abtasten, daemon=True)
+        self._thread.start()
+        return self
+
+    def _abtasten(self):
+        while not self._stopp.wait(ABTASTUNG_S):
+            self.spitze = max(self.spitze, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stopp.set()
+        self._thread.join()
+        self.spitze = max(self.spitze, rss_bytes())
+        return False
+
+
+def aktiv():
+    return _aktiv
+
+
+def aktivieren(an=True, datei=PROFIL_DATEI):
+    global _aktiv, _handler
+    _aktiv = an
+    if an and _handler is None:
+        _handler = logging.FileHandler(datei, encoding="utf-8") if datei else logging.StreamHandler(sys.stderr)
+        _handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+class _Stufe:
+    def __init__(self, name, felder):
+        self.name = name
+        self.felder = felder
+
+    def zaehlen(self, **felder):
+        self.felder.update(felder)
+
+    def __enter__(self):
+        self._speicher = Speicherspitze().__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, typ, fehler, tb):
+        dauer = time.perf_counter() - self._start
+        self._speicher.__exit__()
+        eintrag = {
+            "stufe": self.name,
+            "sekunden": round(dauer, 6),
+            "rss_mb": round(self._speicher.spitze / 2**20, 1),
+            "zuwachs_mb": round((self._speicher.spitze - self._speicher.start) / 2**20, 1),
+            "thread": threading.current_thread().name,
+            **self.felder,
+        }
+        if fehler is not None:
+            eintrag["fehler"] = f"{typ.__name__}: {fehler}"
+        _protokollieren(eintrag)
+        return False
+
+
+class _KeineStufe:
+    def zaehlen(self, **felder):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_KEINE_STUFE = _KeineStufe()
+
+
+def stufe(name, **felder):
+    # Ausgeschaltet kostet eine Stufe nur diesen Aufruf.
+    if not _aktiv:
+        return _KEINE_STUFE
+    return _Stufe(name, felder)
+
+
+def _protokollieren(eintrag):
+    if _handler is None:
+        aktivieren()
+    logger.info(json.dumps(eintrag, ensure_ascii=False, default=str))
+    for liste in getattr(_lokal, "sammler", []):
+        liste.append(eintrag)
+
+
+@contextmanager
+def sammeln():
+    liste = []
+    if not hasattr(_lokal, "sammler"):
+        _lokal.sammler = []
+    _lokal.sammler.append(liste)
+    try:
+        yield liste
+    finally:
+        _lokal.sammler.remove(liste)
+
+
+def zusammenfassung(stufen):
+    teile = []
+    for eintrag in stufen:
+        text = f"{eintrag['stufe']} {eintrag['sekunden']:.2f} s"
+        anzahl = eintrag.get("zeilen", eintrag.get("geometrien"))
+        if anzahl is not None:
+            text += f" ({anzahl:,} {'Zeilen' if 'zeilen' in eintrag else 'Geometrien'})".replace(",", ".")
+        teile.append(text)
+    return " · ".join(teile)
@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from .instrumentation import sammeln
+
+# Die Jobs laufen auf Python-Threads statt im QThreadPool: pyproj hält seinen Kontext pro
+# Python-Thread, und der QThreadPool verwirft den Python-Threadzustand nach jedem Lauf.
+MAX_JOBS = min(4, os.cpu_count() or 1)
+
+logger = logging.getLogger(__name__)
+
+
+class JobAbgebrochen(Exception):
+    pass
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(str, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    stages = pyqtSignal(list)
+
+
+class Job:
+    def __init__(self, ressource, func, *args):
+        self.ressource = ressource
+        self.func = func
+        self.args = args
+        self.signals = JobSignals()
+        self._abbruch = threading.Event()
+
+    def cancel(self):
+        self._abbruch.set()
+
+    @property
+    def cancelled(self):
+        return self._abbruch.is_set()
+
+    def stage(self, text, percent=-1):
+        if self._abbruch.is_set():
+            raise JobAbgebrochen()
+        self.signals.progress.emit(text, percent)
+
+    def run(self):
+        with sammeln() as stufen:
+            try:
+                ergebnis = self.func(*self.args, stage=self.stage)
+            except JobAbgebrochen:
+                ergebnis, signal = None, None
+            except Exception as e:
+                logger.exception("Job %s fehlgeschlagen", self.ressource)
+                ergebnis, signal = str(e), self.signals.failed
+            else:
+                signal = self.signals.finished
+        # Die Messwerte kommen vor dem Ergebnis an, damit die Anzeige sie schon kennt.
+        if stufen:
+            self.signals.stages.emit(stufen)
+        # PyQt liefert bei jedem Zugriff ein neues gebundenes Signal, ein Vergleich mit "is" greift daher nicht.
+        if signal is None:
+            self.signals.cancelled.emit()
+        else:
+            signal.emit(ergebnis)
+
+
+class JobManager(QObject):
+    stages = pyqtSignal(object, list)
+
+    def __init__(self, max_jobs=MAX_JOBS, parent=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="plz2wk-job")
+        self.jobs = {}
+
+    def running(self, ressource):
+        return ressource in self.jobs
+
+    def submit(self, ressource, func, *args):
+        # Pro Ressource läuft höchstens ein Job; ein zweiter Aufruf liefert den laufenden Job zurück.
+        if ressource in self.jobs:
+            return self.jobs[ressource], False
+
+        job = Job(ressource, func, *args)
+        job.signals.finished.connect(lambda _: self._done(ressource))
+        job.signals.failed.connect(lambda _: self._done(ressource))
+        job.signals.cancelled.connect(lambda: self._done(ressource))
+        job.signals.stages.connect(lambda stufen: self.stages.emit(ressource, stufen))
+        self.jobs[ressource] = job
+        self.executor.submit(job.run)
+        return job, True
+
+    def cancel(self, ressource):
+        job = self.jobs.get(ressource)
+        if job:
+            job.cancel()
+
+    def cancel_all(self):
+        for job in self.jobs.values():
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _done(self, ressource):
+        self.jobs.pop(ressource, None)
@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+from .config import JOIN_SPEICHER_MB, ZIEL_CRS
+from .geodata import load_plz, load_wahlkreise
+from .instrumentation import stufe
+from .plzindex import PlzIndex
+
+PLZ_SPALTEN = ["plz", "postleitzahl"]
+ERGEBNIS_SPALTEN = ["plz", "wahlkreis", "note", "einwohner", "qkm"]
+ANTEIL_SPALTEN = ["plz", "wahlkreis", "anteil", "hauptwahlkreis", "note", "einwohner", "qkm"]
+KOORDINATEN_SPALTEN = [
+    (["lon", "lng", "longitude", "laenge", "länge", "laengengrad", "längengrad"], ["lat", "latitude", "breite", "breitengrad"], "EPSG:4326"),
+    # Bloße "x"/"y"-Spalten sind zu unspezifisch, um sie als UTM-Koordinaten zu lesen.
+    (["rechtswert", "ostwert", "easting", "utm_x"], ["hochwert", "nordwert", "northing", "utm_y"], ZIEL_CRS),
+]
+
+
+def find_plz_spalte(columns):
+    plz_spalten = [col for col in columns if col.lower() in PLZ_SPALTEN]
+    return plz_spalten[0] if plz_spalten else None
+
+
+def find_koordinaten_spalten(columns):
+    spalten = {str(col).lower(): col for col in columns}
+    for x_namen, y_namen, crs in KOORDINATEN_SPALTEN:
+        x_spalte = next((spalten[name] for name in x_namen if name in spalten), None)
+        y_spalte = next((spalten[name] for name in y_namen if name in spalten), None)
+        if x_spalte and y_spalte:
+            return x_spalte, y_spalte, crs
+    return None
+
+
+def join_plz_wahlkreise(gdf_plz, gdf_wk):
+    import geopandas as gpd
+
+    with stufe("join", geometrien=len(gdf_plz) + len(gdf_wk)) as s:
+        gdf_joined = gpd.sjoin(gdf_plz, gdf_wk, how="inner", predicate="intersects")
+        result_df = gdf_joined[ERGEBNIS_SPALTEN].drop_duplicates()
+        s.zaehlen(zeilen=len(result_df))
+    return result_df.reset_index(drop=True)
+
+
+def overlap_plz_wahlkreise(gdf_plz, gdf_wk, min_anteil=0.0):
+    with stufe("flaechenanteile", geometrien=len(gdf_plz) + len(gdf_wk)) as s:
+        result_df = _overlap(gdf_plz, gdf_wk, min_anteil)
+        s.zaehlen(zeilen=len(result_df))
+    return result_df
+
+
+def _overlap(gdf_plz, gdf_wk, min_anteil):
+    import shapely
+
+    plz_idx, wk_idx = gdf_wk.sindex.query(gdf_plz.geometry.values, predicate="intersects")
+    plz_geom = gdf_plz.geometry.values[plz_idx]
+    schnitt = shapely.area(shapely.intersection(plz_geom, gdf_wk.geometry.values[wk_idx]))
+
+    paare = pd.DataFrame({
+        "plz": gdf_plz["plz"].to_numpy()[plz_idx],
+        "wahlkreis": gdf_wk["wahlkreis"].to_numpy()[wk_idx],
+        "schnitt": schnitt,
+    })
+    paare = paare.groupby(["plz", "wahlkreis"], sort=False, as_index=False)["schnitt"].sum()
+
+    plz_flaeche = pd.Series(shapely.area(gdf_plz.geometry.values), index=gdf_plz["plz"].to_numpy()).groupby(level=0).sum()
+    flaeche = paare["plz"].map(plz_flaeche).to_numpy()
+    paare["anteil"] = np.divide(paare["schnitt"].to_numpy(), flaeche, out=np.zeros(len(paare)), where=flaeche > 0)
+
+    haupt = paare.loc[paare.groupby("plz")["anteil"].idxmax(), ["plz", "wahlkreis"]]
+    paare["hauptwahlkreis"] = paare["plz"].map(haupt.set_index("plz")["wahlkreis"])
+    # Randsplitter unterhalb der Schwelle fallen weg, der Hauptwahlkreis bleibt immer erhalten.
+    paare = paare[(paare["anteil"] >= min_anteil) | (paare["wahlkreis"] == paare["hauptwahlkreis"])]
+
+    attribute = gdf_plz.drop_duplicates("plz").set_index("plz")[["note", "einwohner", "qkm"]]
+    result_df = paare.join(attribute, on="plz").sort_values(["plz", "anteil"], ascending=[True, False])
+    return result_df[ANTEIL_SPALTEN].reset_index(drop=True)
+
+
+def map_plz_to_wahlkreise(plz_archiv, wk_archiv, min_anteil=None, speicher_mb=JOIN_SPEICHER_MB, max_prozesse=None):
+    if speicher_mb:
+        from .partition import map_kacheln
+
+        return map_kacheln(plz_archiv, wk_archiv, min_anteil, speicher_mb, max_prozesse)
+    gdf_plz = load_plz(plz_archiv)
+    gdf_wk = load_wahlkreise(wk_archiv)
+    if min_anteil is None:
+        return join_plz_wahlkreise(gdf_plz, gdf_wk)
+    return overlap_plz_wahlkreise(gdf_plz, gdf_wk, min_anteil)
+
+
+def lookup_for_plz(gdf_plz, gdf_wk, plz_werte):
+    import geopandas as gpd
+
+    gdf_plz = gdf_plz.loc[gdf_plz["plz"].isin(plz_werte), ["plz", "geometry"]]
+    with stufe("join", geometrien=len(gdf_plz) + len(gdf_wk)) as s:
+        gdf_joined = gpd.sjoin(gdf_plz, gdf_wk[["wahlkreis", "geometry"]], how="left", predicate="intersects")
+        s.zaehlen(zeilen=len(gdf_joined))
+    return gdf_joined[["plz", "wahlkreis"]]
+
+
+def build_lookup(plz_archiv, wk_archiv, plz_werte=None):
+    gdf_plz = load_plz(plz_archiv)
+    gdf_wk = load_wahlkreise(wk_archiv)
+
+    if plz_werte is None:
+        plz_werte = gdf_plz["plz"].unique()
+    return lookup_for_plz(gdf_plz, gdf_wk, plz_werte)
+
+
+def make_index(lookup):
+    # Exotische Schlüssel passen nicht in die Direkttabelle und bleiben beim Merge.
+    try:
+        return PlzIndex.from_frame(lookup)
+    except ValueError:
+        # Wie im Index: jedes Paar nur einmal, Wahlkreise je PLZ aufsteigend.
+        return lookup.drop_duplicates(["plz", "wahlkreis"]).sort_values("wahlkreis", kind="stable")
+
+
+def ganzzahlig(werte):
+    # Fehlende Wahlkreise sollen ganze Nummern nicht blockweise zu Gleitkommazahlen machen.
+    # Text wie "001" bleibt Text; astype würde daraus die Zahl 1 machen.
+    if not pd.api.types.is_numeric_dtype(werte):
+        return werte
+    try:
+        return werte.astype("Int64")
+    except (TypeError, ValueError):
+        return werte
+
+
+def apply_lookup(df, lookup):
+    with stufe("zuordnen", zeilen=len(df)):
+        if isinstance(lookup, PlzIndex):
+            return lookup.apply(df)
+        df = df.copy()
+        df["plz"] = df["plz"].astype(str).str.lower()
+        df = df.merge(lookup, on="plz", how="left")
+        df["wahlkreis"] = ganzzahlig(df["wahlkreis"])
+        return df
+
+
+def _zahlen(series):
+    werte = series.astype(str).str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(werte, errors="coerce").to_numpy(dtype=float)
+
+
+def wahlkreise_for_points(gdf_wk, x, y, crs=ZIEL_CRS):
+    import shapely
+    from pyproj import Transformer
+
+    gueltig = np.isfinite(x) & np.isfinite(y)
+    x, y = x[gueltig], y[gueltig]
+    if crs != ZIEL_CRS:
+        x, y = Transformer.from_crs(crs, ZIEL_CRS, always_xy=True).transform(x, y)
+
+    with stufe("punkte_zuordnen", zeilen=len(x)):
+        # Index über die vielen Punkte, abgefragt mit den wenigen Wahlkreisen: jedes Polygon wird nur einmal vorbereitet.
+        wk_idx, punkt_idx = shapely.STRtree(shapely.points(x, y)).query(gdf_wk.geometry.values, predicate="covers")
+    # Punkte auf einer Grenze zählen nur zum ersten Wahlkreis; die Treffer sind nach Wahlkreis geordnet.
+    punkt_idx, erste = np.unique(punkt_idx, return_index=True)
+    wahlkreise = pd.Series(np.nan, index=np.flatnonzero(gueltig), dtype=object)
+    wahlkreise.iloc[punkt_idx] = gdf_wk["wahlkreis"].to_numpy()[wk_idx[erste]]
+    return gueltig, wahlkreise.infer_objects()
+
+
+def _punkt_treffer(df, gdf_wk, koordinaten):
+    x_spalte, y_spalte, crs = koordinaten
+    gueltig, wahlkreise = wahlkreise_for_points(gdf_wk, _zahlen(df[x_spalte]), _zahlen(df[y_spalte]), crs)
+    # Punkte außerhalb aller Wahlkreise (fremde oder vertauschte Koordinaten) gehen wie Zeilen ohne Koordinaten über die PLZ.
+    return wahlkreise.dropna()
+
+
+def map_chunk(df, lookup, gdf_wk, koordinaten=None, treffer=None):
+    koordinaten = koordinaten or find_koordinaten_spalten(df.columns)
+    if not koordinaten:
+        return apply_lookup(df, lookup)
+
+    df = df.reset_index(drop=True)
+    if "plz" in df.columns:
+        df["plz"] = df["plz"].astype(str).str.lower()
+    if treffer is None:
+        treffer = _punkt_treffer(df, gdf_wk, koordinaten)
+    getroffen = np.zeros(len(df), dtype=bool)
+    getroffen[treffer.index] = True
+
+    mit = df[getroffen].assign(wahlkreis=treffer.to_numpy(), zuordnung="Koordinaten", _zeile=treffer.index.to_numpy())
+    ohne = df[~getroffen].assign(_zeile=np.flatnonzero(~getroffen))
+    if lookup is not None and "plz" in df.columns:
+        ohne = apply_lookup(ohne, lookup)
+    else:
+        ohne = ohne.assign(wahlkreis=np.nan)
+    ohne = ohne.assign(zuordnung="PLZ")
+
+    merged = pd.concat([mit, ohne], ignore_index=True).sort_values("_zeile", kind="stable")
+    merged["wahlkreis"] = ganzzahlig(merged["wahlkreis"])
+    return merged.drop(columns="_zeile").reset_index(drop=True)
+
+
+def map_dataframe(df, plz_archiv, wk_archiv):
+    # Jede PLZ nur einmal räumlich zuordnen und das Ergebnis per Schlüssel auf alle Zeilen verteilen.
+    koordinaten = find_koordinaten_spalten(df.columns)
+    if not koordinaten:
+        plz_werte = df["plz"].astype(str).str.lower().unique()
+        return apply_lookup(df, make_index(build_lookup(plz_archiv, wk_archiv, plz_werte)))
+
+    df = df.reset_index(drop=True)
+    gdf_wk = load_wahlkreise(wk_archiv)
+    treffer = _punkt_treffer(df, gdf_wk, koordinaten)
+    lookup = None
+    if "plz" in df.columns:
+        ohne_treffer = np.ones(len(df), dtype=bool)
+        ohne_treffer[treffer.index] = False
+        plz_werte = df.loc[ohne_treffer, "plz"].astype(str).str.lower().unique()
+        if len(plz_werte):
+            lookup = make_index(build_lookup(plz_archiv, wk_archiv, plz_werte))
+    return map_chunk(df, lookup, gdf_wk, koordinaten, treffer)
@@ -0,0 +1,238 @@
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from .config import JOIN_SPEICHER_MB, ZIEL_CRS
+from .downloads import default_cache
+from .geodata import GEODATEN_DIR, GEODATEN_VERSION, iter_plz, iter_wahlkreise, layer_path
+from .instrumentation import stufe
+from .mapping import ANTEIL_SPALTEN, ERGEBNIS_SPALTEN, join_plz_wahlkreise, overlap_plz_wahlkreise
+
+MAX_PROZESSE = os.cpu_count() or 1
+KOORDINATE_BYTES = 16
+# Geometrien, räumlicher Index und Join-Zwischenergebnisse brauchen grob ein Vielfaches der reinen Koordinaten.
+SPEICHER_FAKTOR = 8
+# Beim Zerlegen darf ein gelesener Block höchstens diesen Teil des Budgets belegen.
+BATCH_ANTEIL = 0.25
+# Kleinere Blöcke zerstückeln die Kacheln in sehr viele winzige Dateien.
+MIN_BATCH_GROESSE = 1024
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _shp_bytes(quelle):
+    if quelle.lower().endswith(".zip"):
+        with zipfile.ZipFile(quelle) as zip_ref:
+            return sum(info.file_size for info in zip_ref.infolist() if info.filename.lower().endswith(".shp"))
+    return os.path.getsize(layer_path(quelle))
+
+
+def raster(plz_archiv, wk_archiv, speicher_mb):
+    anzahl = max(1, math.ceil(SPEICHER_FAKTOR * (_shp_bytes(plz_archiv) + _shp_bytes(wk_archiv)) / (speicher_mb * 2**20)))
+    nx = math.ceil(math.sqrt(anzahl))
+    return nx, math.ceil(anzahl / nx)
+
+
+def batch_groesse(quelle, speicher_mb):
+    import pyogrio
+
+    features = pyogrio.read_info(layer_path(quelle))["features"]
+    bytes_je_feature = _shp_bytes(quelle) / max(features, 1)
+    return max(MIN_BATCH_GROESSE, int(BATCH_ANTEIL * speicher_mb * 2**20 / (SPEICHER_FAKTOR * max(bytes_je_feature, 1))))
+
+
+def _grenzen(quelle):
+    import pyogrio
+    from pyproj import Transformer
+
+    info = pyogrio.read_info(layer_path(quelle), force_total_bounds=True)
+    return Transformer.from_crs(info["crs"], ZIEL_CRS, always_xy=True).transform_bounds(*info["total_bounds"], densify_pts=21)
+
+
+def _koordinaten_bytes(gdf):
+    import shapely
+
+    return KOORDINATE_BYTES * int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+
+
+def _erweitern(grenzen, gdf):
+    neu = gdf.total_bounds
+    return [float(np.fmin(grenzen[0], neu[0])), float(np.fmin(grenzen[1], neu[1])),
+            float(np.fmax(grenzen[2], neu[2])), float(np.fmax(grenzen[3], neu[3]))]
+
+
+def partition_plz(quelle, nx, ny, ziel, batch_size):
+    import shapely
+
+    x0, y0, x1, y1 = _grenzen(quelle)
+    breite, hoehe = max(x1 - x0, 1e-9) / nx, max(y1 - y0, 1e-9) / ny
+    besitzer = {}
+    kacheln = {}
+    with stufe("kacheln_plz", kacheln=nx * ny) as s:
+        for teil, gdf in enumerate(iter_plz(quelle, batch_size)):
+            # Eine PLZ gehört ganz zu der Kachel, in der die linke untere Ecke ihrer ersten Fläche liegt.
+            # So landen alle Teilflächen einer PLZ in derselben Kachel.
+            ecken = shapely.bounds(gdf.geometry.values)
+            ix = np.clip(np.nan_to_num((ecken[:, 0] - x0) // breite), 0, nx - 1)
+            iy = np.clip(np.nan_to_num((ecken[:, 1] - y0) // hoehe), 0, ny - 1)
+            for plz, nr in zip(gdf["plz"].to_numpy(), (iy * nx + ix).astype(int).tolist()):
+                besitzer.setdefault(plz, nr)
+            nummern = gdf["plz"].map(besitzer).to_numpy()
+
+            for nr in np.unique(nummern).tolist():
+                auswahl = gdf[nummern == nr]
+                pfad = os.path.join(ziel, f"plz_{nr:04d}_{teil:05d}.parquet")
+                auswahl.to_parquet(pfad, index=False)
+                kachel = kacheln.setdefault(str(nr), {"dateien": [], "grenzen": [np.inf, np.inf, -np.inf, -np.inf], "bytes": 0})
+                kachel["dateien"].append(os.path.basename(pfad))
+                kachel["grenzen"] = _erweitern(kachel["grenzen"], auswahl)
+                kachel["bytes"] += _koordinaten_bytes(auswahl)
+        s.zaehlen(geometrien=len(besitzer))
+    return kacheln
+
+
+def _tmp_dir():
+    os.makedirs(GEODATEN_DIR, exist_ok=True)
+    return GEODATEN_DIR
+
+
+def _lock(verzeichnis):
+    with _locks_lock:
+        return _locks.setdefault(verzeichnis, threading.Lock())
+
+
+def kachel_verzeichnis(quelle):
+    # ZIP-Archive behalten ihre Kacheln (nur ein Raster je Ebene), lose Shapefiles werden jedes Mal neu zerlegt.
+    if quelle.lower().endswith(".zip"):
+        return os.path.join(GEODATEN_DIR, f"kacheln_v{GEODATEN_VERSION}_{default_cache().content_hash(quelle)}")
+    return tempfile.mkdtemp(prefix="kacheln_", dir=_tmp_dir())
+
+
+def load_plz_kacheln(quelle, verzeichnis, nx, ny, batch_size):
+    manifest = os.path.join(verzeichnis, "kacheln.json")
+    kacheln = None
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            inhalt = json.load(f)
+        if inhalt.get("raster") == [nx, ny]:
+            kacheln = inhalt["kacheln"]
+
+    if kacheln is None:
+        # Ein anderes Raster ersetzt die alten Kacheln, statt eine weitere Kopie der Ebene anzulegen.
+        tmp = f"{verzeichnis}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        kacheln = partition_plz(quelle, nx, ny, tmp, batch_size)
+        with open(os.path.join(tmp, "kacheln.json"), "w", encoding="utf-8") as f:
+            json.dump({"raster": [nx, ny], "kacheln": kacheln}, f)
+        shutil.rmtree(verzeichnis, ignore_errors=True)
+        os.replace(tmp, verzeichnis)
+        if quelle.lower().endswith(".zip"):
+            default_cache().add_derived(quelle, verzeichnis)
+    elif quelle.lower().endswith(".zip"):
+        default_cache().use(quelle)
+
+    for kachel in kacheln.values():
+        kachel["dateien"] = [os.path.join(verzeichnis, name) for name in kachel["dateien"]]
+    return kacheln
+
+
+def partition_wahlkreise(quelle, kacheln, ziel, batch_size):
+    import shapely
+
+    nummern = sorted(kacheln)
+    grenzen = np.array([kacheln[nr]["grenzen"] for nr in nummern]).reshape(-1, 4)
+    teile = {}
+    with stufe("kacheln_wk", kacheln=len(nummern)) as s:
+        for teil, gdf in enumerate(iter_wahlkreise(quelle, batch_size)):
+            # Ein Wahlkreis kommt in jede Kachel, deren PLZ-Ausdehnung seine Bounding-Box berührt.
+            ecken = shapely.bounds(gdf.geometry.values)
+            treffer = (
+                (ecken[:, 0] <= grenzen[:, 2:3]) & (ecken[:, 2] >= grenzen[:, 0:1])
+                & (ecken[:, 1] <= grenzen[:, 3:4]) & (ecken[:, 3] >= grenzen[:, 1:2])
+            )
+            for i in np.flatnonzero(treffer.any(axis=1)).tolist():
+                auswahl = gdf[treffer[i]]
+                pfad = os.path.join(ziel, f"wk_{int(nummern[i]):04d}_{teil:05d}.parquet")
+                auswahl.to_parquet(pfad, index=False)
+                eintrag = teile.setdefault(nummern[i], {"dateien": [], "bytes": 0})
+                eintrag["dateien"].append(pfad)
+                eintrag["bytes"] += _koordinaten_bytes(auswahl)
+        s.zaehlen(kacheln=len(teile))
+    return teile
+
+
+def _lesen(dateien):
+    import geopandas as gpd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Alle Teile liegen in ZIEL_CRS. Das CRS aus den Metadaten jedes Teils zu lesen (PROJJSON) dauert länger als der Join.
+    df = pa.concat_tables([pq.read_table(pfad) for pfad in dateien]).to_pandas()
+    return gpd.GeoDataFrame(df.drop(columns="geometry"), geometry=gpd.GeoSeries.from_wkb(df["geometry"].to_numpy(), crs=ZIEL_CRS))
+
+
+def _join_kachel(plz_dateien, wk_dateien, min_anteil):
+    gdf_plz = _lesen(plz_dateien)
+    gdf_wk = _lesen(wk_dateien)
+    if min_anteil is None:
+        return join_plz_wahlkreise(gdf_plz, gdf_wk)
+    return overlap_plz_wahlkreise(gdf_plz, gdf_wk, min_anteil)
+
+
+def map_kacheln(plz_archiv, wk_archiv, min_anteil=None, speicher_mb=JOIN_SPEICHER_MB, max_prozesse=None, on_done=None):
+    speicher = speicher_mb * 2**20
+    nx, ny = raster(plz_archiv, wk_archiv, speicher_mb)
+    plz_verzeichnis = kachel_verzeichnis(plz_archiv)
+    teile = []
+    # Ein Join mit anderem Raster würde die Kacheln ersetzen; er wartet, bis dieser fertig ist.
+    with _lock(plz_verzeichnis):
+        try:
+            kacheln = load_plz_kacheln(plz_archiv, plz_verzeichnis, nx, ny, batch_groesse(plz_archiv, speicher_mb))
+            with tempfile.TemporaryDirectory(prefix="wk_kacheln_", dir=_tmp_dir()) as tmp:
+                wk_teile = partition_wahlkreise(wk_archiv, kacheln, tmp, batch_groesse(wk_archiv, speicher_mb))
+                # Kacheln ohne Wahlkreis liefern beim inneren Join nichts.
+                auftraege = [(kacheln[nr]["dateien"], wk_teile[nr]["dateien"]) for nr in sorted(kacheln) if nr in wk_teile]
+                groesste = max((SPEICHER_FAKTOR * (kacheln[nr]["bytes"] + wk_teile[nr]["bytes"]) for nr in wk_teile), default=0)
+                # Parallel nur so viele Kacheln, wie zusammen ins Budget passen.
+                prozesse = max(1, min(max_prozesse or MAX_PROZESSE, len(auftraege), int(speicher // max(groesste, 1))))
+
+                if prozesse == 1:
+                    for plz_dateien, wk_dateien in auftraege:
+                        teile.append(_join_kachel(plz_dateien, wk_dateien, min_anteil))
+                        if on_done:
+                            on_done(len(teile), len(auftraege))
+                else:
+                    # "spawn" statt fork wie bei den Wahlen im Stapel.
+                    executor = ProcessPoolExecutor(prozesse, mp_context=multiprocessing.get_context("spawn"))
+                    try:
+                        futures = [executor.submit(_join_kachel, plz_dateien, wk_dateien, min_anteil) for plz_dateien, wk_dateien in auftraege]
+                        for future in as_completed(futures):
+                            teile.append(future.result())
+                            if on_done:
+                                on_done(len(teile), len(auftraege))
+                    finally:
+                        executor.shutdown(cancel_futures=True)
+        finally:
+            if not plz_archiv.lower().endswith(".zip"):
+                shutil.rmtree(plz_verzeichnis, ignore_errors=True)
+
+    if min_anteil is None:
+        if not teile:
+            return pd.DataFrame(columns=ERGEBNIS_SPALTEN)
+        result_df = pd.concat(teile, ignore_index=True)[ERGEBNIS_SPALTEN].drop_duplicates()
+        return result_df.sort_values(["plz", "wahlkreis"], kind="stable").reset_index(drop=True)
+    if not teile:
+        return pd.DataFrame(columns=ANTEIL_SPALTEN)
+    result_df = pd.concat(teile, ignore_index=True)
+    return result_df.sort_values(["plz", "anteil"], ascending=[True, False], kind="stable")[ANTEIL_SPALTEN].reset_index(drop=True)
@@ -0,0 +1,154 @@
+import os
+import threading
+
+import pandas as pd
+
+from .batch import map_editionen
+from .config import CACHE_DIR, PLZ_URL
+from .diff import diff_archive
+from .downloads import download
+from .export import write_chunks
+from .filtering import FilterIndex
+from .geodata import load_plz
+from .instrumentation import stufe
+from .mapping import find_koordinaten_spalten, find_plz_spalte, map_dataframe, map_plz_to_wahlkreise
+from .plzindex import PlzIndex
+
+INDEX_DIR = os.path.join(CACHE_DIR, "indizes")
+
+_plz_lock = threading.Lock()
+_plz_archiv = None
+
+
+def _no_stage(text, percent=-1):
+    pass
+
+
+def prepare_plz(stage=_no_stage):
+    global _plz_archiv
+    with _plz_lock:
+        if _plz_archiv and os.path.exists(_plz_archiv):
+            return _plz_archiv
+
+        stage("PLZ-Daten werden heruntergeladen...")
+        plz_archiv = download(PLZ_URL, progress=lambda p: stage("PLZ-Daten werden heruntergeladen...", p))
+        stage("Bereite PLZ-Geodaten vor...")
+        load_plz(plz_archiv)
+        _plz_archiv = plz_archiv
+        return _plz_archiv
+
+
+def prepare_wahl(url, store, min_anteil=None, basis=None, stage=_no_stage):
+    plz_archiv = prepare_plz(stage)
+
+    stage(f"Lade: {url}")
+    wk_archiv = download(url, progress=lambda p: stage(f"Lade: {url}", p))
+
+    variante = "" if min_anteil is None else f"anteil:{min_anteil}"
+    schluessel = store.key_for(plz_archiv, wk_archiv, variante)
+    result_df = store.get(schluessel)
+    bericht = None
+    basis_df = None
+    if result_df is None and min_anteil is None and basis and basis != wk_archiv and os.path.exists(basis):
+        basis_df = store.get(store.key_for(plz_archiv, basis))
+    if basis_df is not None:
+        # Gegenüber der zuvor gewählten Einteilung nur die PLZ an geänderten Wahlkreisen neu prüfen.
+        stage("Vergleiche mit vorheriger Wahlkreiseinteilung...")
+        result_df, bericht, _ = diff_archive(plz_archiv, basis, wk_archiv, store, basis_df)
+    elif result_df is None:
+        stage("Verarbeite Geodaten...")
+        result_df = map_plz_to_wahlkreise(plz_archiv, wk_archiv, min_anteil)
+        stage("Speichere Zuordnung...")
+        store.put(schluessel, result_df)
+    return {
+        "url": url,
+        "plz_archiv": plz_archiv,
+        "wk_archiv": wk_archiv,
+        "min_anteil": min_anteil,
+        "result_df": result_df,
+        "bericht": bericht,
+    }
+
+
+def prepare_index(url, store, stage=_no_stage):
+    plz_archiv = prepare_plz(stage)
+    wk_archiv = fetch_archive(url, stage)
+
+    pfad = os.path.join(INDEX_DIR, f"{store.key_for(plz_archiv, wk_archiv)}.plzidx")
+    if not os.path.exists(pfad):
+        result_df = prepare_wahl(url, store, stage=stage)["result_df"]
+        stage("Erzeuge PLZ-Index...")
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        PlzIndex.from_frame(result_df).save(pfad)
+    return PlzIndex.load(pfad)
+
+
+def fetch_editionen(links, stage=_no_stage):
+    # Pro Wahljahr genügt eine Ausgabe der Wahlkreise.
+    wk_archive = {}
+    for jahr, url in links:
+        if str(jahr) not in wk_archive:
+            wk_archive[str(jahr)] = fetch_archive(url, stage)
+    return wk_archive
+
+
+def prepare_batch(links, max_prozesse=None, stage=_no_stage):
+    plz_archiv = prepare_plz(stage)
+    wk_archive = fetch_editionen(links, stage)
+
+    stage(f"Ordne {len(wk_archive)} Wahlen zu...", 0)
+    return map_editionen(
+        plz_archiv,
+        wk_archive,
+        max_prozesse,
+        on_done=lambda fertig, gesamt: stage(f"Ordne Wahlen zu ({fertig}/{gesamt})...", int(fertig * 100 / gesamt)),
+    )
+
+
+def read_table(file_path):
+    with stufe("datei_lesen", datei=os.path.basename(file_path)) as s:
+        if file_path.endswith(".csv"):
+            df = pd.read_csv(file_path, dtype=str)
+        else:
+            df = pd.read_excel(file_path, dtype=str)
+        s.zaehlen(zeilen=len(df))
+    return df
+
+
+def export_result(chunks, pfad, gesamt, stage=_no_stage):
+    text = f"Exportiere {gesamt:,} Zeilen...".replace(",", ".")
+    stage(text, 0)
+    return write_chunks(chunks, pfad, on_chunk=lambda zeilen: stage(text, int(zeilen * 100 / max(gesamt, 1))))
+
+
+def map_upload(file_path, plz_archiv, wk_archiv, stage=_no_stage):
+    stage("Lese Datei...")
+    df = read_table(file_path)
+
+    plz_spalte = find_plz_spalte(df.columns)
+    if not plz_spalte and not find_koordinaten_spalten(df.columns):
+        raise ValueError("Die Datei muss eine Spalte namens 'plz' oder 'Postleitzahl' oder Koordinatenspalten enthalten.")
+    if plz_spalte:
+        df.rename(columns={plz_spalte: "plz"}, inplace=True)
+
+    stage("Ordne Postleitzahlen zu...")
+    return map_dataframe(df, plz_archiv, wk_archiv)
+
+
+def fetch_archive(url, stage=_no_stage):
+    stage(f"Lade: {url}")
+    return download(url, progress=lambda p: stage(f"Lade: {url}", p))
+
+
+def mit_filter(func, *args, stage=_no_stage):
+    # Den Suchindex für den Tabellenfilter gleich im Job bauen; in der Oberfläche blockierte er beim ersten Tastendruck.
+    ergebnis = func(*args, stage=stage)
+    df = ergebnis["result_df"] if isinstance(ergebnis, dict) else ergebnis
+    stage("Bereite Tabellenfilter vor...")
+    with stufe("filterindex", zeilen=len(df)):
+        return ergebnis, FilterIndex(df.reset_index(drop=True)).vorbereiten()
+
+
+def map_shapefiles(plz_archiv, wk_shapefile, stage=_no_stage):
+    stage("Lade und verarbeite Shapefiles...")
+    return map_plz_to_wahlkreise(plz_archiv, wk_shapefile)[["plz", "wahlkreis"]].drop_duplicates()
@@ -0,0 +1,158 @@
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+SLOTS = 100_000
+KEIN_WAHLKREIS = -1
+MAGIC = b"PLZWKIDX"
+INDEX_VERSION = 1
+HEADER = struct.Struct("<8sIII")
+HEADER_BYTES = 64
+# Bis hierhin ist die Prüfung in Python schneller als factorize und fullmatch.
+KLEINE_ANFRAGE = 10_000
+
+
+def _plz_code(wert):
+    text = str(wert)
+    return int(text) if len(text) == 5 and text.isascii() and text.isdigit() else -1
+
+
+def plz_codes(plz):
+    # Nur echte fünfstellige PLZ bekommen einen Platz; alles andere bleibt ohne Treffer wie beim Merge.
+    if len(plz) <= KLEINE_ANFRAGE:
+        return np.array([_plz_code(wert) for wert in plz], dtype=np.int32)
+    werte = pd.Series(plz).astype(str).str.lower()
+    # Jede verschiedene PLZ nur einmal prüfen und umwandeln.
+    labels, eindeutig = pd.factorize(werte)
+    eindeutig = pd.Series(eindeutig, dtype=object)
+    gueltig = eindeutig.str.fullmatch(r"[0-9]{5}").fillna(False).to_numpy(dtype=bool)
+    # Der zusätzliche letzte Platz fängt fehlende Werte ab, die factorize mit -1 kennzeichnet.
+    codes = np.full(len(eindeutig) + 1, -1, dtype=np.int32)
+    codes[:-1][gueltig] = eindeutig[gueltig].astype(np.int32).to_numpy()
+    return codes[labels]
+
+
+def _ausrichten(offset):
+    return (offset + 7) // 8 * 8
+
+
+class PlzIndex:
+    def __init__(self, haupt, ueberlauf_plz, ueberlauf_start, ueberlauf_wk):
+        self.haupt = haupt
+        self.ueberlauf_plz = ueberlauf_plz
+        self.ueberlauf_start = ueberlauf_start
+        self.ueberlauf_wk = ueberlauf_wk
+
+    @classmethod
+    def from_frame(cls, result_df):
+        spalten = ["plz", "wahlkreis"] + (["hauptwahlkreis"] if "hauptwahlkreis" in result_df.columns else [])
+        paare = result_df[spalten].dropna(subset=["plz", "wahlkreis"]).drop_duplicates(["plz", "wahlkreis"])
+        codes = plz_codes(paare["plz"])
+        if (codes < 0).any():
+            raise ValueError(f"Keine fünfstellige PLZ: {paare['plz'].iloc[np.flatnonzero(codes < 0)[0]]}")
+        wahlkreise = pd.to_numeric(paare["wahlkreis"], errors="coerce").to_numpy(dtype=float)
+        if not np.isfinite(wahlkreise).all() or (wahlkreise != np.round(wahlkreise)).any() \
+                or (wahlkreise < 0).any() or (wahlkreise > np.iinfo(np.int16).max).any():
+            raise ValueError("Wahlkreisnummern müssen ganze Zahlen zwischen 0 und 32767 sein.")
+        wahlkreise = wahlkreise.astype(np.int16)
+
+        # Der Hauptwahlkreis steht vorn, danach die übrigen Wahlkreise aufsteigend.
+        if "hauptwahlkreis" in paare.columns:
+            ist_haupt = (paare["wahlkreis"] == paare["hauptwahlkreis"]).to_numpy()
+        else:
+            ist_haupt = np.zeros(len(paare), dtype=bool)
+        reihenfolge = np.lexsort((wahlkreise, ~ist_haupt, codes))
+        codes, wahlkreise = codes[reihenfolge], wahlkreise[reihenfolge]
+
+        plz, start, anzahl = np.unique(codes, return_index=True, return_counts=True)
+        haupt = np.full(SLOTS, KEIN_WAHLKREIS, dtype=np.int16)
+        haupt[plz] = wahlkreise[start]
+
+        geteilt = anzahl > 1
+        ueberlauf_plz = plz[geteilt].astype(np.int32)
+        ueberlauf_start = np.concatenate([[0], np.cumsum(anzahl[geteilt])]).astype(np.int32)
+        von = np.repeat(start[geteilt], anzahl[geteilt])
+        schritt = np.arange(len(von)) - np.repeat(ueberlauf_start[:-1], anzahl[geteilt])
+        ueberlauf_wk = wahlkreise[von + schritt]
+        return cls(haupt, ueberlauf_plz, ueberlauf_start, ueberlauf_wk)
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in (self.haupt, self.ueberlauf_plz, self.ueberlauf_start, self.ueberlauf_wk))
+
+    def save(self, pfad):
+        tmp = f"{pfad}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, INDEX_VERSION, len(self.ueberlauf_plz), len(self.ueberlauf_wk)).ljust(HEADER_BYTES, b"\0"))
+            for arr in (self.haupt, self.ueberlauf_plz, self.ueberlauf_start, self.ueberlauf_wk):
+                f.write(b"\0" * (_ausrichten(f.tell()) - f.tell()))
+                f.write(np.ascontiguousarray(arr).tobytes())
+        os.replace(tmp, pfad)
+
+    @classmethod
+    def load(cls, pfad):
+        with open(pfad, "rb") as f:
+            magic, version, n_geteilt, n_werte = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{pfad} ist kein PLZ-Index der Version {INDEX_VERSION}.")
+
+        # Nur lesend einblenden: alle Prozesse teilen sich dieselben Seiten im Dateicache.
+        arrays = []
+        offset = HEADER_BYTES
+        for dtype, laenge in ((np.int16, SLOTS), (np.int32, n_geteilt), (np.int32, n_geteilt + 1), (np.int16, n_werte)):
+            offset = _ausrichten(offset)
+            if laenge:
+                arrays.append(np.memmap(pfad, dtype=dtype, mode="r", offset=offset, shape=(laenge,)))
+            else:
+                arrays.append(np.zeros(0, dtype=dtype))
+            offset += laenge * np.dtype(dtype).itemsize
+        return cls(*arrays)
+
+    def lookup(self, plz):
+        codes = plz_codes(plz)
+        wahlkreise = np.full(len(codes), KEIN_WAHLKREIS, dtype=np.int16)
+        gueltig = codes >= 0
+        wahlkreise[gueltig] = self.haupt[codes[gueltig]]
+        return wahlkreise
+
+    def lookup_all(self, plz):
+        codes = plz_codes(plz)
+        haupt = np.full(len(codes), KEIN_WAHLKREIS, dtype=np.int16)
+        gueltig = codes >= 0
+        haupt[gueltig] = self.haupt[codes[gueltig]]
+
+        zeilen = np.arange(len(codes))
+        if not len(self.ueberlauf_plz):
+            return zeilen, haupt
+
+        pos = np.searchsorted(self.ueberlauf_plz, codes)
+        pos_begrenzt = np.minimum(pos, len(self.ueberlauf_plz) - 1)
+        geteilt = gueltig & (np.asarray(self.ueberlauf_plz)[pos_begrenzt] == codes)
+        if not geteilt.any():
+            return zeilen, haupt
+
+        # Zeilen mit geteilter PLZ werden je Wahlkreis wiederholt, wie beim Merge auf die Zuordnung.
+        start = np.asarray(self.ueberlauf_start)
+        anzahl = np.ones(len(codes), dtype=np.int64)
+        anzahl[geteilt] = start[pos[geteilt] + 1] - start[pos[geteilt]]
+        ziel_start = np.cumsum(anzahl) - anzahl
+        wahlkreise = np.repeat(haupt, anzahl)
+
+        teil = np.flatnonzero(geteilt)
+        teil_anzahl = anzahl[teil]
+        schritt = np.arange(teil_anzahl.sum()) - np.repeat(np.cumsum(teil_anzahl) - teil_anzahl, teil_anzahl)
+        ziel = np.repeat(ziel_start[teil], teil_anzahl) + schritt
+        quelle = np.repeat(start[pos[teil]], teil_anzahl) + schritt
+        wahlkreise[ziel] = np.asarray(self.ueberlauf_wk)[quelle]
+        return np.repeat(zeilen, anzahl), wahlkreise
+
+    def apply(self, df):
+        df = df.reset_index(drop=True)
+        df["plz"] = df["plz"].astype(str).str.lower()
+        zeilen, wahlkreise = self.lookup_all(df["plz"])
+        result = df.iloc[zeilen].reset_index(drop=True)
+        # Immer Int64, damit Blöcke mit und ohne Fehlschläge denselben Typ haben.
+        result["wahlkreis"] = pd.arrays.IntegerArray(wahlkreise.astype(np.int64), wahlkreise == KEIN_WAHLKREIS)
+        return result
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from .config import AKTUELLES_JAHR, BASIS_URL, CACHE_DIR, DOWNLOAD_REGEX, STARTJAHR
+from .instrumentation import stufe
+
+MANIFEST_PFAD = os.path.join(CACHE_DIR, "wahlen.json")
+MAX_VERBINDUNGEN = 8
+
+logger = logging.getLogger(__name__)
+
+
+def make_session(max_verbindungen=MAX_VERBINDUNGEN):
+    # Beim Programmstart wird nur das Manifest gelesen; requests und bs4 kommen erst zum Abruf dazu.
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_verbindungen, pool_maxsize=max_verbindungen)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def parse_links(jahr, url, html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    link_tags = soup.find_all('a', href=True)
+    matching_links = [tag['href'] for tag in link_tags if DOWNLOAD_REGEX.search(tag['href'])]
+    return [(jahr, urljoin(url, link)) for link in matching_links]
+
+
+def fetch_page(session, jahr, eintrag=None, timeout=10):
+    url = BASIS_URL.format(jahr)
+    headers = {}
+    if eintrag and eintrag.get("etag"):
+        headers["If-None-Match"] = eintrag["etag"]
+    if eintrag and eintrag.get("last_modified"):
+        headers["If-Modified-Since"] = eintrag["last_modified"]
+
+    r = session.get(url, headers=headers, timeout=timeout)
+    if r.status_code == 304 and eintrag:
+        return eintrag
+    # Nur 404 heißt "keine Wahl in diesem Jahr"; andere Fehler (z.B. Wartungsseiten) behalten den alten Eintrag.
+    if r.status_code == 404:
+        return {"jahr": jahr, "url": url, "etag": None, "last_modified": None, "links": []}
+    r.raise_for_status()
+
+    return {
+        "jahr": jahr,
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "links": [link for _, link in parse_links(jahr, url, r.text)],
+    }
+
+
+def scrape_links(jahr, timeout=10):
+    eintrag = fetch_page(make_session(1), jahr, timeout=timeout)
+    return eintrag["url"], [(jahr, link) for link in eintrag["links"]]
+
+
+def load_manifest(pfad=MANIFEST_PFAD):
+    try:
+        with open(pfad, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"seiten": {}}
+
+
+def save_manifest(manifest, pfad=MANIFEST_PFAD):
+    os.makedirs(os.path.dirname(pfad), exist_ok=True)
+    tmp = f"{pfad}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, pfad)
+
+
+def links_from_manifest(manifest, jahre=None):
+    links = []
+    gewaehlt = None if jahre is None else {str(jahr) for jahr in jahre}
+    for jahr in sorted(manifest["seiten"], key=int):
+        if gewaehlt is not None and jahr not in gewaehlt:
+            continue
+        eintrag = manifest["seiten"][jahr]
+        links.extend((eintrag["jahr"], link) for link in eintrag["links"])
+    return links
+
+
+def scrape_all(jahre=None, manifest=None, on_page=None, max_verbindungen=MAX_VERBINDUNGEN, timeout=10):
+    jahre = jahre or list(range(STARTJAHR, AKTUELLES_JAHR + 1))
+    manifest = manifest if manifest is not None else load_manifest()
+    session = make_session(max_verbindungen)
+
+    def abrufen(jahr):
+        alt = manifest["seiten"].get(str(jahr))
+        try:
+            eintrag, ok = fetch_page(session, jahr, alt, timeout), True
+        except Exception as e:
+            logger.warning("Fehler beim Abrufen von %s: %s", BASIS_URL.format(jahr), e)
+            eintrag, ok = alt, False
+        if on_page:
+            on_page(BASIS_URL.format(jahr), ok and bool(eintrag and eintrag["links"]))
+        return jahr, eintrag
+
+    with stufe("scrape", seiten=len(jahre)), session, ThreadPoolExecutor(max_workers=max_verbindungen) as executor:
+        for jahr, eintrag in executor.map(abrufen, jahre):
+            if eintrag:
+                manifest["seiten"][str(jahr)] = eintrag
+
+    try:
+        save_manifest(manifest)
+    except OSError as e:
+        logger.warning("Fehler beim Speichern des Manifests: %s", e)
+    return links_from_manifest(manifest, jahre)
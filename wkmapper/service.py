@@ -0,0 +1,180 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from .mapping import find_plz_spalte
+from .plzindex import KEIN_WAHLKREIS
+
+MAX_BODY_BYTES = 16 * 1024 * 1024
+STATUS_TEXTE = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+}
+
+
+class AnfrageFehler(Exception):
+    def __init__(self, status, text):
+        super().__init__(text)
+        self.status = status
+
+
+def parse_plz_body(body, content_type):
+    text = body.decode("utf-8-sig")
+    if "json" in content_type or text.lstrip()[:1] in ("[", "{"):
+        try:
+            daten = json.loads(text)
+        except ValueError as e:
+            raise AnfrageFehler(400, f"Ungültiges JSON: {e}")
+        plz_werte = daten.get("plz") if isinstance(daten, dict) else daten
+        if not isinstance(plz_werte, list):
+            raise AnfrageFehler(400, "Erwartet wird eine Liste von PLZ oder {\"plz\": [...]}.")
+        return [str(plz) for plz in plz_werte], "json"
+
+    zeilen = [zeile for zeile in csv.reader(io.StringIO(text)) if zeile]
+    if not zeilen:
+        return [], "csv"
+    # Mit Kopfzeile wird die PLZ-Spalte gesucht, ohne Kopfzeile gilt die erste Spalte.
+    plz_spalte = find_plz_spalte(zeilen[0])
+    if plz_spalte is not None:
+        spalte = zeilen[0].index(plz_spalte)
+        zeilen = zeilen[1:]
+    else:
+        spalte = 0
+    return [zeile[spalte].strip() if len(zeile) > spalte else "" for zeile in zeilen], "csv"
+
+
+class LookupService:
+    def __init__(self, indizes):
+        self.indizes = indizes
+        self.gestartet = time.time()
+        self.anfragen = 0
+        self.fehler = 0
+        self.plz_gesamt = 0
+        self.lookup_sekunden = 0.0
+
+    def lookup(self, plz_werte):
+        start = time.perf_counter()
+        ergebnis = {}
+        for wahl, index in self.indizes.items():
+            zeilen, wahlkreise = index.lookup_all(plz_werte)
+            zeilen, wahlkreise = zeilen.tolist(), wahlkreise.tolist()
+            listen = [[] for _ in plz_werte]
+            for zeile, wahlkreis in zip(zeilen, wahlkreise):
+                if wahlkreis != KEIN_WAHLKREIS:
+                    listen[zeile].append(wahlkreis)
+            ergebnis[wahl] = listen
+        self.plz_gesamt += len(plz_werte)
+        self.lookup_sekunden += time.perf_counter() - start
+        return ergebnis
+
+    def metrics(self):
+        return {
+            "status": "ok",
+            "wahlen": list(self.indizes),
+            "laufzeit_s": round(time.time() - self.gestartet, 1),
+            "anfragen": self.anfragen,
+            "fehler": self.fehler,
+            "plz_abgefragt": self.plz_gesamt,
+            "mikrosekunden_je_plz": round(self.lookup_sekunden * 1e6 / self.plz_gesamt, 3) if self.plz_gesamt else None,
+        }
+
+    def antwort(self, plz_werte, ergebnis, format):
+        if format == "csv":
+            out = io.StringIO()
+            schreiber = csv.writer(out, lineterminator="\n")
+            schreiber.writerow(["plz"] + list(ergebnis))
+            for i, plz in enumerate(plz_werte):
+                schreiber.writerow([plz] + [", ".join(map(str, listen[i])) for listen in ergebnis.values()])
+            return "text/csv; charset=utf-8", out.getvalue().encode("utf-8")
+
+        eintraege = [
+            {"plz": plz, "wahlkreise": {wahl: listen[i] for wahl, listen in ergebnis.items()}}
+            for i, plz in enumerate(plz_werte)
+        ]
+        return "application/json", json.dumps({"ergebnisse": eintraege}, ensure_ascii=False).encode("utf-8")
+
+    def dispatch(self, methode, ziel, headers, body):
+        url = urlsplit(ziel)
+        parameter = parse_qs(url.query)
+        if url.path == "/health":
+            if methode != "GET":
+                raise AnfrageFehler(405, "Nur GET erlaubt.")
+            return "application/json", json.dumps(self.metrics()).encode("utf-8")
+
+        if url.path != "/lookup":
+            raise AnfrageFehler(404, f"Unbekannter Pfad: {url.path}")
+        if methode == "GET":
+            plz_werte = [plz for wert in parameter.get("plz", []) for plz in wert.split(",") if plz]
+            if not plz_werte:
+                raise AnfrageFehler(400, "Parameter 'plz' fehlt.")
+            format = "json"
+        elif methode == "POST":
+            plz_werte, format = parse_plz_body(body, headers.get("content-type", ""))
+        else:
+            raise AnfrageFehler(405, "Nur GET und POST erlaubt.")
+
+        if "text/csv" in headers.get("accept", ""):
+            format = "csv"
+        format = parameter.get("format", [format])[0]
+        return self.antwort(plz_werte, self.lookup(plz_werte), format)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                zeile = await reader.readline()
+                if not zeile.strip():
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, wert = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = wert.strip()
+
+                offen = True
+                gelesen = False
+                try:
+                    methode, ziel, version = zeile.decode("latin-1").split()
+                    offen = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    laenge = int(headers.get("content-length", 0))
+                    if laenge > MAX_BODY_BYTES:
+                        raise AnfrageFehler(413, f"Anfrage größer als {MAX_BODY_BYTES} Bytes.")
+                    body = await reader.readexactly(laenge) if laenge else b""
+                    gelesen = True
+                    self.anfragen += 1
+                    status, (typ, inhalt) = 200, self.dispatch(methode, ziel, headers, body)
+                except (AnfrageFehler, ValueError) as e:
+                    self.fehler += 1
+                    # Ein ungelesener Body würde sonst als nächste Anfragezeile gelesen.
+                    if not gelesen:
+                        offen = False
+                    status = getattr(e, "status", 400)
+                    typ, inhalt = "application/json", json.dumps({"fehler": str(e)}, ensure_ascii=False).encode("utf-8")
+
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXTE[status]}\r\n"
+                    f"Content-Type: {typ}\r\n"
+                    f"Content-Length: {len(inhalt)}\r\n"
+                    f"Connection: {'keep-alive' if offen else 'close'}\r\n\r\n".encode("latin-1") + inhalt
+                )
+                await writer.drain()
+                if not offen:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=8000):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"PLZ-Dienst für {', '.join(service.indizes)} läuft auf http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from .config import CACHE_DIR, STORE_MAX_BYTES
+from .downloads import file_hash
+from .mapping import ANTEIL_SPALTEN, ERGEBNIS_SPALTEN
+
+# Bei Änderungen an der Zuordnungslogik erhöhen, damit alte Einträge nicht mehr passen.
+MAPPING_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dateien (
+    pfad TEXT PRIMARY KEY,
+    groesse INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS eintraege (
+    schluessel TEXT PRIMARY KEY,
+    zeilen INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    erstellt REAL NOT NULL,
+    zuletzt REAL NOT NULL,
+    spalten TEXT
+);
+CREATE TABLE IF NOT EXISTS zuordnung (
+    schluessel TEXT NOT NULL,
+    plz TEXT,
+    wahlkreis,
+    note TEXT,
+    einwohner INTEGER,
+    qkm REAL,
+    anteil REAL,
+    hauptwahlkreis
+);
+CREATE INDEX IF NOT EXISTS zuordnung_schluessel ON zuordnung (schluessel);
+"""
+
+NEUE_SPALTEN = {
+    "eintraege": [("spalten", "TEXT")],
+    "zuordnung": [("anteil", "REAL"), ("hauptwahlkreis", "")],
+}
+
+
+class LookupStore:
+    def __init__(self, pfad=None, max_bytes=STORE_MAX_BYTES):
+        self.pfad = pfad or os.path.join(CACHE_DIR, "zuordnungen.sqlite")
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.pfad), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+            for tabelle, spalten in NEUE_SPALTEN.items():
+                vorhanden = {row[1] for row in conn.execute(f"PRAGMA table_info({tabelle})")}
+                for name, typ in spalten:
+                    if name not in vorhanden:
+                        conn.execute(f"ALTER TABLE {tabelle} ADD COLUMN {name} {typ}")
+
+    def _connect(self):
+        return sqlite3.connect(self.pfad, timeout=30)
+
+    def archive_hash(self, pfad):
+        pfad = os.path.abspath(pfad)
+        st = os.stat(pfad)
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT sha256 FROM dateien WHERE pfad = ? AND groesse = ? AND mtime_ns = ?",
+                (pfad, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+            if row:
+                return row[0]
+            sha = file_hash(pfad)
+            conn.execute(
+                "INSERT OR REPLACE INTO dateien (pfad, groesse, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (pfad, st.st_size, st.st_mtime_ns, sha),
+            )
+            return sha
+
+    def key_for(self, plz_archiv, wk_archiv, variante=""):
+        teile = [f"v{MAPPING_VERSION}", self.archive_hash(plz_archiv), self.archive_hash(wk_archiv), variante]
+        return hashlib.sha256(":".join(teile).encode()).hexdigest()
+
+    def get(self, schluessel):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT spalten FROM eintraege WHERE schluessel = ?", (schluessel,)).fetchone()
+            if not row:
+                return None
+            spalten = row[0].split(",") if row[0] else ERGEBNIS_SPALTEN
+            conn.execute("UPDATE eintraege SET zuletzt = ? WHERE schluessel = ?", (time.time(), schluessel))
+            return pd.read_sql_query(
+                f"SELECT {', '.join(spalten)} FROM zuordnung WHERE schluessel = ? ORDER BY rowid",
+                conn,
+                params=(schluessel,),
+            )
+
+    def put(self, schluessel, result_df):
+        spalten = [col for col in result_df.columns if col in ANTEIL_SPALTEN]
+        groesse = int(result_df.memory_usage(deep=True).sum())
+        jetzt = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM zuordnung WHERE schluessel = ?", (schluessel,))
+            result_df[spalten].assign(schluessel=schluessel).to_sql(
+                "zuordnung", conn, if_exists="append", index=False
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO eintraege (schluessel, zeilen, bytes, erstellt, zuletzt, spalten) VALUES (?, ?, ?, ?, ?, ?)",
+                (schluessel, len(result_df), groesse, jetzt, jetzt, ",".join(spalten)),
+            )
+        self.evict()
+
+    def invalidate(self, schluessel):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM zuordnung WHERE schluessel = ?", (schluessel,))
+            conn.execute("DELETE FROM eintraege WHERE schluessel = ?", (schluessel,))
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM zuordnung")
+            conn.execute("DELETE FROM eintraege")
+            conn.execute("DELETE FROM dateien")
+        with closing(self._connect()) as conn:
+            conn.execute("VACUUM")
+
+    def evict(self):
+        with closing(self._connect()) as conn:
+            eintraege = conn.execute("SELECT schluessel, bytes FROM eintraege ORDER BY zuletzt DESC").fetchall()
+        belegt = 0
+        for index, (schluessel, groesse) in enumerate(eintraege):
+            if index > 0 and belegt + groesse > self.max_bytes:
+                self.invalidate(schluessel)
+            else:
+                belegt += groesse
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from .filtering import FilterIndex, display_text
+
+
+class DataFrameModel(QAbstractTableModel):
+    def __init__(self, df, headers=None, parent=None, filter_index=None):
+        super().__init__(parent)
+        self._df = df.reset_index(drop=True)
+        self._headers = list(headers) if headers is not None else [str(col) for col in self._df.columns]
+        # Nur Verweise auf die Arrays des Frames; to_numpy() würde kopieren und aus Int64 float64 machen.
+        self._spalten = [self._df.iloc[:, i].array for i in range(self._df.shape[1])]
+        self._formate = [int if pd.api.types.is_integer_dtype(spalte.dtype) else str for spalte in self._spalten]
+        self._sortierung = np.arange(len(self._df))
+        self._maske = None
+        self._zeilen = self._sortierung
+        self._filter = filter_index or FilterIndex(self._df)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._zeilen)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._spalten)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+        wert = self._spalten[index.column()][self._zeilen[index.row()]]
+        if pd.isna(wert):
+            return ""
+        return str(self._formate[index.column()](wert))
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self._headers[section] if section < len(self._headers) else None
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if column < 0 or column >= len(self._spalten):
+            return
+        self.layoutAboutToBeChanged.emit()
+        werte = self._df.iloc[:, column]
+        aufsteigend = order == Qt.SortOrder.AscendingOrder
+        try:
+            self._sortierung = werte.sort_values(ascending=aufsteigend, kind="stable").index.to_numpy()
+        except TypeError:
+            self._sortierung = display_text(werte).sort_values(ascending=aufsteigend, kind="stable").index.to_numpy()
+
+        alte_zeilen = self._zeilen
+        self._apply_mask()
+        neue_position = np.full(len(self._df), -1)
+        neue_position[self._zeilen] = np.arange(len(self._zeilen))
+        alte_indizes = self.persistentIndexList()
+        neue_indizes = [self.index(int(neue_position[alte_zeilen[i.row()]]), i.column()) for i in alte_indizes]
+        self.changePersistentIndexList(alte_indizes, neue_indizes)
+        self.layoutChanged.emit()
+
+    def set_filter(self, text):
+        maske = self._filter.match(text)
+        self.beginResetModel()
+        self._maske = maske
+        self._apply_mask()
+        self.endResetModel()
+
+    def _apply_mask(self):
+        if self._maske is None:
+            self._zeilen = self._sortierung
+        else:
+            self._zeilen = self._sortierung[self._maske[self._sortierung]]
+
+    def chunks(self, groesse, headers=True):
+        # Sortierung und Filter zum Aufrufzeitpunkt festhalten; die Blöcke entstehen erst beim Schreiben.
+        df, zeilen = self._df, self._zeilen
+        namen = self._headers if headers else df.columns
+        return (df.iloc[zeilen[start:start + groesse]].set_axis(namen, axis=1) for start in range(0, max(len(zeilen), 1), groesse))
+
+    def frame(self, headers=True):
+        df = self._df.iloc[self._zeilen]
+        if headers:
+            df = df.set_axis(self._headers, axis=1)
+        return df